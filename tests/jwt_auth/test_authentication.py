@@ -0,0 +1,46 @@
+import time
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from zc_common.jwt_auth.authentication import JWTAuthentication, JWTVerificationCache
+
+
+@patch.object(JWTAuthentication, 'get_jwt_value', return_value=b'token')
+class JWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.cache = JWTVerificationCache(10)
+        self.payload = {'id': '1', 'roles': ['user'], 'exp': int(time.time()) + 60}
+
+    def authenticate(self, cache):
+        with patch('zc_common.jwt_auth.authentication.get_jwt_verification_cache', return_value=cache), \
+                patch('zc_common.jwt_auth.authentication.jwt_decode_handler',
+                      return_value=self.payload) as mock_decode:
+            for _ in range(3):
+                user, token = JWTAuthentication().authenticate(Mock())
+
+                self.assertEqual(user.id, '1')
+                self.assertEqual(user.roles, ['user'])
+        return mock_decode.call_count
+
+    def test_authenticate__verifies_every_token_without_cache(self, mock_get_jwt_value):
+        self.assertEqual(self.authenticate(None), 3)
+
+    def test_authenticate__verifies_each_token_once(self, mock_get_jwt_value):
+        self.assertEqual(self.authenticate(self.cache), 1)
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 1, 'size': 1})
+
+    def test_authenticate__does_not_cache_expired_tokens(self, mock_get_jwt_value):
+        self.payload['exp'] = int(time.time()) - 60
+
+        self.assertEqual(self.authenticate(self.cache), 3)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_authenticate__users_do_not_share_cached_payloads(self, mock_get_jwt_value):
+        with patch('zc_common.jwt_auth.authentication.get_jwt_verification_cache', return_value=self.cache), \
+                patch('zc_common.jwt_auth.authentication.jwt_decode_handler', return_value=self.payload):
+            user, _ = JWTAuthentication().authenticate(Mock())
+            user.roles.append('staff')
+            other_user, _ = JWTAuthentication().authenticate(Mock())
+
+        self.assertEqual(other_user.roles, ['user'])
@@ -0,0 +1,23 @@
+from django.db import connection
+from django.test import TestCase
+
+
+class ModelTablesTestCase(TestCase):
+    """
+    Creates the tables of `models` for the tests of the class, since the test models have no migrations.
+    """
+    models = ()
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as schema_editor:
+            for model in cls.models:
+                schema_editor.create_model(model)
+        super(ModelTablesTestCase, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ModelTablesTestCase, cls).tearDownClass()
+        with connection.schema_editor() as schema_editor:
+            for model in reversed(cls.models):
+                schema_editor.delete_model(model)
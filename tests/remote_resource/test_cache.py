@@ -0,0 +1,49 @@
+import time
+from unittest import TestCase
+
+from zc_common.remote_resource.cache import LocMemBackend, RemoteResourceCache
+
+
+def document(resource_type, pk):
+    return {'data': {'type': resource_type, 'id': pk}, 'included': []}
+
+
+class RemoteResourceCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = RemoteResourceCache(LocMemBackend(100), ttls={'company': 60})
+
+    def test_only_caches_configured_types(self):
+        self.assertTrue(self.cache.is_cached('company'))
+        self.assertFalse(self.cache.is_cached('user'))
+
+    def test_get_many(self):
+        self.cache.set_many('company', {'1': document('company', '1')}, '', ['user'])
+
+        self.assertEqual(self.cache.get_many('company', ['1', '2'], '', ['user']),
+                         {'1': (document('company', '1'), True)})
+
+    def test_keys_on_include_and_roles(self):
+        self.cache.set_many('company', {'1': document('company', '1')}, '', ['user', 'staff'])
+
+        self.assertEqual(list(self.cache.get_many('company', ['1'], '', ['staff', 'user'])), ['1'])
+        self.assertEqual(self.cache.get_many('company', ['1'], '', ['user']), {})
+        self.assertEqual(self.cache.get_many('company', ['1'], 'locations', ['user', 'staff']), {})
+
+    def test_invalidate_pk(self):
+        self.cache.set_many('company', {'1': document('company', '1'), '2': document('company', '2')}, '', ['user'])
+        self.cache.invalidate('company', 1)
+
+        self.assertEqual(list(self.cache.get_many('company', ['1', '2'], '', ['user'])), ['2'])
+
+    def test_invalidate_type(self):
+        self.cache.set_many('company', {'1': document('company', '1'), '2': document('company', '2')}, '', ['user'])
+        self.cache.invalidate('company')
+
+        self.assertEqual(self.cache.get_many('company', ['1', '2'], '', ['user']), {})
+
+    def test_stale_documents(self):
+        cache = RemoteResourceCache(LocMemBackend(100), ttls={'company': 0.05}, stale_ttl=10)
+        cache.set_many('company', {'1': document('company', '1')}, '', ['user'])
+        time.sleep(0.1)
+
+        self.assertEqual(cache.get_many('company', ['1'], '', ['user']), {'1': (document('company', '1'), False)})
@@ -0,0 +1,162 @@
+import time
+from unittest import TestCase, skipUnless
+
+from django.db import connection, models
+from mock import Mock, patch
+
+from zc_common.remote_resource.filters import FilterPlan, JSONAPIFilterBackend, clear_filter_plans
+
+
+class FilterTag(models.Model):
+    name = models.TextField()
+
+    class Meta:
+        app_label = 'tests'
+
+
+class FilterItem(models.Model):
+    name = models.TextField()
+    active = models.BooleanField(default=True)
+    tags = models.ManyToManyField(FilterTag)
+
+    class Meta:
+        app_label = 'tests'
+
+
+class FilterPlanTestCase(TestCase):
+    def setUp(self):
+        self.plan = FilterPlan(None, {'id': ['in', 'exact'], 'active': ['exact'], 'tags': ['exact']}, FilterItem)
+
+    def test_parse(self):
+        self.assertEqual(self.plan.parse('id__in', '1,2'), ('id', '1,2'))
+        self.assertEqual(self.plan.parse('active', 'false'), ('active', False))
+        self.assertEqual(self.plan.parse('tags', '1,2'), ('tags', ['1', '2']))
+
+    def test_parse__memoizes_each_filter_string(self):
+        with patch.object(self.plan, '_get_parser', wraps=self.plan._get_parser) as get_parser:
+            for value in ('true', 'false', '1'):
+                self.plan.parse('active', value)
+
+        self.assertEqual(get_parser.call_count, 1)
+
+    def test_parse__only_memoizes_allowed_fields(self):
+        for filter_string in ('name', 'name__icontains', 'id__in', 'id__unknown'):
+            self.plan.parse(filter_string, 'a')
+            self.plan.get_array_field(filter_string)
+
+        self.assertEqual(sorted(self.plan._parsers), ['id__in', 'id__unknown'])
+        self.assertEqual(sorted(self.plan._array_fields), ['id__in', 'id__unknown'])
+
+    def test_parse__memoized_filter_strings_are_bounded(self):
+        with patch.object(FilterPlan, 'max_filter_strings', 10):
+            for index in range(25):
+                self.plan.parse('id__lookup{}'.format(index), '1')
+
+        self.assertEqual(len(self.plan._parsers), 5)
+
+
+class JSONAPIFilterBackendTestCase(TestCase):
+    def setUp(self):
+        clear_filter_plans()
+        self.backend = JSONAPIFilterBackend()
+        self.view = Mock(filter_fields={'id': ['in', 'exact'], 'name': ['icontains', 'exact']})
+        self.queryset = Mock(model=FilterItem)
+
+    def test_unknown_filter_field(self):
+        request = Mock(query_params={'filter[name]': 'a', 'filter[active]': 'true'})
+
+        with patch.object(self.backend, 'get_filter_class', return_value=None):
+            self.assertEqual(self.backend.filter_queryset(request, self.queryset, self.view),
+                             self.queryset.none.return_value)
+
+    def test_filter_plan_is_built_once_per_view_and_model(self):
+        request = Mock(query_params={'filter[name]': 'a', 'page': '2'})
+        filter_class = Mock()
+
+        with patch.object(self.backend, 'get_filter_class', return_value=filter_class) as get_filter_class:
+            for _ in range(3):
+                self.backend.filter_queryset(request, self.queryset, self.view)
+
+        self.assertEqual(get_filter_class.call_count, 1)
+        filter_class.assert_called_with({'name': 'a'}, queryset=self.queryset)
+
+
+class FilterInArrayTestCase(TestCase):
+    def setUp(self):
+        clear_filter_plans()
+        self.backend = JSONAPIFilterBackend()
+        self.view = Mock(filter_fields={'id': ['in', 'exact'], 'name': ['icontains', 'exact']})
+        self.queryset = Mock(model=FilterItem, db='default')
+        self.ids = ','.join(str(pk) for pk in range(10000))
+
+    def filter_queryset(self, query_params, filters=None, declared_filters=None):
+        filter_class = Mock(declared_filters=declared_filters or {})
+        filter_class.get_filters.return_value = filters or {}
+        connection = Mock(vendor='postgresql')
+        connection.ops.quote_name = lambda name: '"{}"'.format(name)
+        connection.ops.validate_autopk_value = lambda value: value
+
+        with patch.object(self.backend, 'get_filter_class', return_value=filter_class), \
+                patch('zc_common.remote_resource.filters.connections', {'default': connection}), \
+                patch('zc_common.remote_resource.filters.zc_settings', FILTER_IN_ARRAY_THRESHOLD=1000):
+            self.backend.filter_queryset(Mock(query_params=query_params), self.queryset, self.view)
+        return filter_class
+
+    def test_large_id_lists_are_bound_as_a_single_array(self):
+        filter_class = self.filter_queryset({'filter[id__in]': self.ids, 'filter[name]': 'a'})
+
+        self.queryset.extra.assert_called_once_with(
+            where=['"tests_filteritem"."id" = ANY(%s)'], params=[list(range(10000))])
+        filter_class.assert_called_once_with({'name': 'a'}, queryset=self.queryset.extra.return_value)
+
+    def test_short_id_lists_are_left_to_the_filter_class(self):
+        filter_class = self.filter_queryset({'filter[id__in]': '1,2,3'})
+
+        self.assertFalse(self.queryset.extra.called)
+        filter_class.assert_called_once_with({'id__in': '1,2,3'}, queryset=self.queryset)
+
+    def test_generated_filters_are_bound_as_a_single_array(self):
+        self.filter_queryset({'filter[id__in]': self.ids}, filters={'id__in': Mock(method=None, action=None)})
+
+        self.assertTrue(self.queryset.extra.called)
+
+    def test_custom_filters_are_left_to_the_filter_class(self):
+        id_filter = Mock(method=None, action=None)
+        for filters, declared_filters in (
+                ({'id__in': Mock(method='filter_ids', action=None)}, None),
+                ({'id__in': Mock(method=None, action=Mock())}, None),
+                ({'id__in': id_filter}, {'id__in': id_filter})):
+            clear_filter_plans()
+            self.queryset.reset_mock()
+            filter_class = self.filter_queryset({'filter[id__in]': self.ids}, filters, declared_filters)
+
+            self.assertFalse(self.queryset.extra.called)
+            filter_class.assert_called_once_with({'id__in': self.ids}, queryset=self.queryset)
+
+    def test_invalid_ids(self):
+        self.filter_queryset({'filter[id__in]': self.ids + ',abc'})
+
+        self.assertFalse(self.queryset.extra.called)
+        self.assertTrue(self.queryset.none.called)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Array parameters are specific to PostgreSQL')
+class FilterInArrayBenchmarkTestCase(TestCase):
+    """
+    Compares the time PostgreSQL takes to parse and plan a filter on 10,000 ids bound one by one and as an array.
+    """
+
+    def explain(self, sql, params):
+        start = time.time()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN SELECT id FROM generate_series(1, 100000) AS t(id) WHERE ' + sql, params)
+            cursor.fetchall()
+        return time.time() - start
+
+    def test_array_is_cheaper_than_in_list(self):
+        ids = list(range(10000))
+
+        in_time = self.explain('id IN ({})'.format(', '.join(['%s'] * len(ids))), ids)
+        array_time = self.explain('id = ANY(%s)', [ids])
+
+        self.assertLess(array_time, in_time)
@@ -0,0 +1,280 @@
+import threading
+import time
+from unittest import TestCase
+
+import ujson
+from mock import Mock, patch
+
+from zc_common.remote_resource.cache import LocMemBackend, RemoteResourceCache
+from zc_common.remote_resource.includes import (
+    CircuitBreaker, RemoteIncludeCollector, RemoteResourceIncludeError, RemoteResourceIncludeTimeoutError,
+    RemoteResourceUnavailableError, split_compound_document)
+
+
+def remote_response(resource_type, pk, status=200, included=None):
+    if status >= 400:
+        body = {'errors': [{'status': str(status), 'detail': 'Error'}]}
+    else:
+        body = {'data': {'type': resource_type, 'id': pk}}
+        if included:
+            body['included'] = included
+    return {'status': status, 'body': ujson.dumps(body)}
+
+
+class SleepingEventClient(object):
+    """
+    Answers like zc_events' `get_remote_resource_data()`, with the same signature. Ids in `missing_ids` are left
+    out of list responses.
+    """
+
+    def __init__(self, delay=0, missing_ids=()):
+        self.delay = delay
+        self.missing_ids = missing_ids
+        self.calls = []
+
+    def get_remote_resource_data(self, resource_type, pk=None, user_id=None, include=None, page_size=None,
+                                 related_resource=None, query_params=None, roles=None):
+        kwargs = {'user_id': user_id, 'include': include, 'page_size': page_size,
+                  'related_resource': related_resource, 'query_params': query_params, 'roles': roles}
+        self.calls.append((resource_type, pk, kwargs))
+        time.sleep(self.delay)
+        if pk is None:
+            pks = query_params['filter[id__in]'].split(',')
+            body = {'data': [{'type': resource_type, 'id': id_} for id_ in pks if id_ not in self.missing_ids]}
+            return {'status': 200, 'body': ujson.dumps(body)}
+        return remote_response(resource_type, pk)
+
+
+class ConcurrentEventClient(SleepingEventClient):
+    """
+    Holds every call until `expected_calls` calls are in flight at once, or a few seconds passed, and records the
+    largest number of calls in flight.
+    """
+
+    def __init__(self, expected_calls):
+        super(ConcurrentEventClient, self).__init__()
+        self.expected_calls = expected_calls
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._all_in_flight = threading.Event()
+
+    def get_remote_resource_data(self, *args, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.in_flight == self.expected_calls:
+                self._all_in_flight.set()
+
+        self._all_in_flight.wait(5)
+        try:
+            return super(ConcurrentEventClient, self).get_remote_resource_data(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class RemoteIncludeCollectorTestCase(TestCase):
+    def setUp(self):
+        self.request = Mock()
+        self.request.user = Mock(id=1, roles=['user'])
+
+    def test_fetch__no_pending_includes(self):
+        event_client = Mock()
+        collector = RemoteIncludeCollector(self.request, event_client)
+
+        self.assertEqual(collector.fetch(), [])
+        self.assertFalse(event_client.get_remote_resource_data.called)
+
+    def test_fetch__serial_keeps_registration_order(self):
+        event_client = SleepingEventClient()
+        collector = RemoteIncludeCollector(self.request, event_client, max_workers=1)
+        collector.add('user', '1', '')
+        collector.add('company', '2', 'locations')
+
+        included = collector.fetch()
+
+        self.assertEqual(included, [{'type': 'user', 'id': '1'}, {'type': 'company', 'id': '2'}])
+        self.assertEqual(event_client.calls[1][2]['include'], 'locations')
+        self.assertEqual(event_client.calls[1][2]['roles'], ['user'])
+
+    def test_fetch__concurrent_calls_are_in_flight_at_once(self):
+        event_client = ConcurrentEventClient(expected_calls=5)
+        collector = RemoteIncludeCollector(self.request, event_client, max_workers=5)
+        for pk in range(5):
+            collector.add('user', str(pk), '')
+
+        included = collector.fetch()
+
+        self.assertEqual(event_client.max_in_flight, 5)
+        self.assertEqual([item['id'] for item in included], ['0', '1', '2', '3', '4'])
+
+    def test_fetch__includes_remote_compound_documents(self):
+        event_client = Mock()
+        event_client.get_remote_resource_data.return_value = remote_response(
+            'company', '2', included=[{'type': 'location', 'id': '3'}])
+        collector = RemoteIncludeCollector(self.request, event_client)
+        collector.add('company', '2', 'locations')
+
+        self.assertEqual(collector.fetch(), [{'type': 'company', 'id': '2'}, {'type': 'location', 'id': '3'}])
+
+    def test_fetch__error_status(self):
+        event_client = Mock()
+        event_client.get_remote_resource_data.return_value = remote_response('user', '1', status=404)
+        collector = RemoteIncludeCollector(self.request, event_client)
+        collector.add('user', '1', '')
+
+        with self.assertRaises(RemoteResourceIncludeError) as context:
+            collector.fetch()
+        self.assertEqual(context.exception.data[0]['meta'], {'include_field': 'user'})
+
+    def test_fetch__deadline_exceeded(self):
+        event_client = SleepingEventClient(delay=0.5)
+        collector = RemoteIncludeCollector(self.request, event_client, max_workers=2, timeout=0.1)
+        collector.add('user', '1', '')
+        collector.add('company', '2', '')
+
+        with self.assertRaises(RemoteResourceIncludeTimeoutError):
+            collector.fetch()
+
+    def test_fetch__batches_ids_by_type(self):
+        event_client = SleepingEventClient()
+        collector = RemoteIncludeCollector(self.request, event_client, batch_size=2)
+        for pk in ('1', '2', '3'):
+            collector.add('user', pk, '')
+        collector.add('company', '4', '')
+
+        included = collector.fetch()
+
+        self.assertEqual([(item['type'], item['id']) for item in included],
+                         [('user', '1'), ('user', '2'), ('user', '3'), ('company', '4')])
+        self.assertEqual(len(event_client.calls), 3)
+        self.assertEqual(event_client.calls[0][2]['query_params'], {'filter[id__in]': '1,2'})
+        self.assertEqual(event_client.calls[1][2]['query_params'], {'filter[id__in]': '3'})
+        self.assertEqual(event_client.calls[2][1], '4')
+
+    def test_fetch__batch_missing_ids(self):
+        event_client = SleepingEventClient(missing_ids=('2',))
+        collector = RemoteIncludeCollector(self.request, event_client, batch_size=2)
+        collector.add('user', '1', '')
+        collector.add('user', '2', '')
+
+        with self.assertRaises(RemoteResourceIncludeError) as context:
+            collector.fetch()
+        self.assertEqual(context.exception.data[0]['status'], '404')
+
+    def test_fetch__each_distinct_document_once(self):
+        event_client = SleepingEventClient()
+        collector = RemoteIncludeCollector(self.request, event_client)
+        for _ in range(3):
+            collector.add('company', '1', '')
+        collector.add('company', '1', 'locations')
+
+        included = collector.fetch()
+
+        self.assertEqual(len(event_client.calls), 2)
+        self.assertEqual(len(included), 2)
+        self.assertEqual(collector.stats(), {'hits': 2, 'misses': 2})
+
+        collector.add('company', '1', '')
+        self.assertEqual(collector.fetch(), [])
+        self.assertEqual(collector.stats(), {'hits': 3, 'misses': 2})
+
+    def test_fetch__shared_cache(self):
+        cache = RemoteResourceCache(LocMemBackend(100), ttls={'user': 60})
+        event_client = SleepingEventClient()
+
+        for _ in range(2):
+            collector = RemoteIncludeCollector(self.request, event_client, batch_size=10, cache=cache)
+            collector.add('user', '1', '')
+            collector.add('user', '2', '')
+            collector.add('company', '3', '')
+            included = collector.fetch()
+
+            self.assertEqual(sorted(item['id'] for item in included), ['1', '2', '3'])
+
+        # Users are only fetched by the first collector, companies are not cached
+        self.assertEqual([call[1] for call in event_client.calls], [None, '3', '3'])
+
+    def test_fetch__serves_stale_documents_and_refreshes_them(self):
+        cache = RemoteResourceCache(LocMemBackend(100), ttls={'user': 60}, stale_ttl=600)
+        # Cached two minutes ago, so that the document outlived its TTL
+        with patch('zc_common.remote_resource.cache.time', Mock(time=Mock(return_value=time.time() - 120))):
+            cache.set_many('user', {'1': {'data': {'type': 'user', 'id': '1', 'attributes': {'old': True}},
+                                          'included': []}}, '', ['user'])
+
+        event_client = SleepingEventClient()
+        collector = RemoteIncludeCollector(self.request, event_client, cache=cache)
+        collector.add('user', '1', '')
+
+        # Refresh in the calling thread, so that the refreshed document is cached once `fetch()` returns
+        refresh_pool = Mock(apply_async=lambda func, args: func(*args))
+        with patch('zc_common.remote_resource.includes._refresh_pool', refresh_pool):
+            self.assertEqual(collector.fetch()[0]['attributes'], {'old': True})
+
+        self.assertEqual(cache.get_many('user', ['1'], '', ['user']),
+                         {'1': ({'data': {'type': 'user', 'id': '1'}, 'included': []}, True)})
+        self.assertEqual(len(event_client.calls), 1)
+
+    def test_fetch__fails_fast_while_circuit_is_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, cool_down=60)
+        breaker.record_failure()
+        event_client = SleepingEventClient()
+        collector = RemoteIncludeCollector(self.request, event_client)
+        collector.add('user', '1', '')
+
+        with patch('zc_common.remote_resource.includes.get_circuit_breaker', return_value=breaker):
+            with self.assertRaises(RemoteResourceUnavailableError):
+                collector.fetch()
+        self.assertEqual(event_client.calls, [])
+
+
+class CircuitBreakerTestCase(TestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, cool_down=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow_request())
+
+    def test_lets_a_single_trial_through_after_cool_down(self):
+        breaker = CircuitBreaker(failure_threshold=1, cool_down=0.05)
+        breaker.record_failure()
+        time.sleep(0.1)
+
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow_request())
+
+
+class SplitCompoundDocumentTestCase(TestCase):
+    def test_keeps_linked_included_documents(self):
+        body = {
+            'data': [
+                {'type': 'company', 'id': '1', 'relationships': {
+                    'locations': {'data': [{'type': 'location', 'id': '10'}]}}},
+                {'type': 'company', 'id': '2', 'relationships': {'locations': {'data': []}}},
+            ],
+            'included': [
+                {'type': 'location', 'id': '10', 'relationships': {
+                    'address': {'data': {'type': 'address', 'id': '100'}}}},
+                {'type': 'address', 'id': '100'},
+            ]
+        }
+
+        documents = split_compound_document(body)
+
+        self.assertEqual([item['id'] for item in documents['1']['included']], ['10', '100'])
+        self.assertEqual(documents['2']['included'], [])
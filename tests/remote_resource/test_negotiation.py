@@ -0,0 +1,53 @@
+import os
+from unittest import TestCase
+
+from mock import Mock, patch
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.parsers import JSONParser as DRFJSONParser
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.utils.mediatypes import order_by_precedence
+
+import tests
+
+# The renderers module looks up the event client on the root module of the Django settings
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+tests.event_client = Mock()
+
+from zc_common.remote_resource.negotiation import (  # noqa: E402
+    JsonAPIContentNegotiation, clear_negotiation_caches)
+from zc_common.remote_resource.parsers import JSONParser  # noqa: E402
+from zc_common.remote_resource.renderers import JSONRenderer  # noqa: E402
+
+
+class JsonAPIContentNegotiationTestCase(TestCase):
+    def setUp(self):
+        clear_negotiation_caches()
+        self.negotiation = JsonAPIContentNegotiation()
+
+    def test_select_renderer__negotiates_each_accept_header_once(self):
+        request = Mock(META={'HTTP_ACCEPT': 'application/vnd.api+json'})
+
+        with patch('zc_common.remote_resource.negotiation.order_by_precedence',
+                   side_effect=order_by_precedence) as mock_order_by_precedence:
+            for _ in range(3):
+                renderers = [BrowsableAPIRenderer(), JSONRenderer()]
+                renderer, media_type = self.negotiation.select_renderer(request, renderers)
+
+                self.assertIs(renderer, renderers[1])
+                self.assertEqual(media_type, 'application/vnd.api+json')
+
+        self.assertEqual(mock_order_by_precedence.call_count, 1)
+
+    def test_select_renderer__not_acceptable(self):
+        request = Mock(META={'HTTP_ACCEPT': 'application/xml'})
+
+        for _ in range(2):
+            with self.assertRaises(NotAcceptable):
+                self.negotiation.select_renderer(request, [JSONRenderer()])
+
+    def test_select_parser(self):
+        parsers = [JSONParser(), DRFJSONParser()]
+
+        for _ in range(2):
+            self.assertIs(self.negotiation.select_parser(Mock(content_type='application/json'), parsers), parsers[1])
+            self.assertIsNone(self.negotiation.select_parser(Mock(content_type='text/plain'), parsers))
@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+from django.core.paginator import EmptyPage
+from mock import Mock, patch
+from rest_framework.pagination import Cursor
+
+from zc_common.remote_resource import pagination as pagination_module
+from zc_common.remote_resource.pagination import CursorPagination, PageNumberPagination, Paginator
+
+
+class PaginatorTestCase(TestCase):
+    def test_countless_pages(self):
+        paginator = Paginator(list(range(25)), 10, count_mode='none')
+
+        self.assertTrue(paginator.page(2).has_next())
+        page = paginator.page(3)
+        self.assertEqual(list(page), [20, 21, 22, 23, 24])
+        self.assertFalse(page.has_next())
+        self.assertEqual(page.previous_page_number(), 2)
+        self.assertIsNone(paginator.count)
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+
+class PageNumberPaginationTestCase(TestCase):
+    def test_paginated_response_without_count(self):
+        request = Mock(query_params={'count': 'none', 'page': '2'})
+        request.build_absolute_uri.return_value = 'http://testserver/people?count=none&page=2'
+        pagination = PageNumberPagination()
+        pagination.page_size = 10
+
+        self.assertEqual(pagination.paginate_queryset(list(range(25)), request), list(range(10, 20)))
+        response = pagination.get_paginated_response([])
+
+        self.assertEqual(response.data['meta'], {'pagination': {'page': 2}})
+        self.assertIsNone(response.data['links']['last'])
+        self.assertEqual(response.data['links']['next'], 'http://testserver/people?count=none&page=3')
+
+    def test_links_parse_the_url_once(self):
+        """
+        The links of a page filtered on thousands of ids are all built from a single parse of the request URL.
+        """
+        ids = ','.join(str(pk) for pk in range(5000))
+        url = 'http://testserver/people?filter%5Bid__in%5D=' + ids + '&page=3'
+        request = Mock(query_params={'page': '3'})
+        request.build_absolute_uri.return_value = url
+        pagination = PageNumberPagination()
+        pagination.page_size = 10
+        pagination.paginate_queryset(list(range(100)), request)
+
+        urlparse = pagination_module.urlparse
+        with patch.object(urlparse, 'urlsplit', wraps=urlparse.urlsplit) as urlsplit:
+            links = pagination.get_paginated_response([]).data['links']
+
+        self.assertEqual(urlsplit.call_count, 1)
+        self.assertEqual(request.build_absolute_uri.call_count, 1)
+        self.assertEqual(links['self'], pagination_module.remove_query_param(url, 'page'))
+        for name, page in (('first', 1), ('last', 10), ('next', 4), ('prev', 2)):
+            self.assertEqual(links[name], pagination_module.replace_query_param(url, 'page', page))
+
+
+class CursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.paginator = CursorPagination()
+        self.paginator.base_url = 'http://testserver/people?cursor=cD0x&filter%5Bid__in%5D='
+        self.paginator.page_size = 10
+
+    def test_links_keep_blank_query_params(self):
+        link = self.paginator.encode_cursor(Cursor(offset=0, reverse=False, position='5'))
+
+        self.assertEqual(link, 'http://testserver/people?cursor=cD01&filter%5Bid__in%5D=')
+
+    def test_paginated_response(self):
+        self.paginator.has_next = False
+        self.paginator.has_previous = False
+
+        response = self.paginator.get_paginated_response([])
+
+        self.assertEqual(response.data['meta'], {'pagination': {'page_size': 10}})
+        self.assertEqual(response.data['links'], {
+            'self': 'http://testserver/people?cursor=cD0x&filter%5Bid__in%5D=',
+            'first': 'http://testserver/people?filter%5Bid__in%5D=',
+            'next': None,
+            'prev': None,
+        })
@@ -0,0 +1,147 @@
+import io
+from unittest import TestCase
+
+import ujson
+from mock import Mock, patch
+from rest_framework.exceptions import ParseError
+from rest_framework_json_api.exceptions import Conflict
+
+from zc_common.remote_resource import utils
+from zc_common.remote_resource.parsers import JSONParser, PrimaryDataScanner, StreamingJSONParser
+
+
+def parse_with_copies(result):
+    """
+    The previous parse path, which formatted the whole document recursively and then copied the relationships.
+    """
+    data = result['data']
+    parsed_data = {'id': data.get('id')}
+    parsed_data.update(utils.format_keys(data['attributes'], 'underscore'))
+    for field_name, field_data in utils.format_keys(data['relationships'], 'underscore').items():
+        field_data = field_data.get('data')
+        if isinstance(field_data, list):
+            field_data = list(relation for relation in field_data)
+        parsed_data[field_name] = field_data
+    return parsed_data
+
+
+class JSONParserTestCase(TestCase):
+    def parse(self, result):
+        parser_context = {'view': Mock(resource_name='people'), 'request': Mock(method='POST')}
+        return JSONParser().parse(Mock(raw_body=result), parser_context=parser_context)
+
+    def get_document(self, relationships=1, ids=1):
+        return {
+            'data': {
+                'type': 'people',
+                'attributes': {'firstName': 'John', 'homeAddress': {'zipCode': '94107'}},
+                'relationships': dict(
+                    ('relation{}'.format(index), {'data': [{'type': 'tags', 'id': str(pk)} for pk in range(ids)]})
+                    for index in range(relationships)
+                ),
+            }
+        }
+
+    def test_parse(self):
+        document = self.get_document()
+        document['data']['relationships']['homeCity'] = {'data': {'type': 'cities', 'id': '1', 'meta': {'isMain': 1}}}
+        document['data']['relationships']['company'] = {'data': None}
+
+        self.assertEqual(self.parse(document), {
+            'id': None,
+            'first_name': 'John',
+            'home_address': {'zip_code': '94107'},
+            'relation0': [{'type': 'tags', 'id': '0'}],
+            'home_city': {'type': 'cities', 'id': '1', 'meta': {'is_main': 1}},
+            'company': None,
+        })
+
+    def test_parse__list_of_resource_objects(self):
+        document = {'data': [{'type': 'people', 'attributes': {'firstName': name}} for name in ('John', 'Jane')]}
+
+        self.assertEqual(self.parse(document),
+                         [{'id': None, 'first_name': 'John'}, {'id': None, 'first_name': 'Jane'}])
+
+    def test_malformed_documents(self):
+        for document in ([], {'data': ['people']},
+                         {'data': {'type': 'people', 'relationships': {'company': []}}}):
+            with self.assertRaises(ParseError):
+                self.parse(document)
+
+    def test_large_bulk_write_payload(self):
+        """
+        A document with hundreds of relationships is parsed as the previous parser did, formatting each relationship
+        name once and keeping the resource identifier objects as they are instead of copying them.
+        """
+        document = self.get_document(relationships=500, ids=20)
+
+        with patch('zc_common.remote_resource.utils.format_key', wraps=utils.format_key) as format_key:
+            parsed = self.parse(document)
+
+        self.assertEqual(parsed, parse_with_copies(document))
+        # The 500 relationship names, and the 2 attributes and the nested key of the attributes
+        self.assertEqual(format_key.call_count, 503)
+        self.assertIs(parsed['relation0'][0], document['data']['relationships']['relation0']['data'][0])
+
+
+class PrimaryDataScannerTestCase(TestCase):
+    def scan(self, document, chunk_size=7):
+        return list(PrimaryDataScanner(io.BytesIO(document.encode('utf-8')), chunk_size))
+
+    def test_yields_each_resource_object(self):
+        data = [{'type': 'people', 'id': str(pk), 'attributes': {'name': u'J\u00e9r\u00f4me "{[\\', 'age': pk}}
+                for pk in range(50)]
+        document = ujson.dumps({'meta': {'skipped': ['}', {'data': []}]}, 'data': data, 'included': []},
+                               ensure_ascii=False)
+
+        for chunk_size in (1, 2, 7, 4096):
+            self.assertEqual(self.scan(document, chunk_size), data)
+
+    def test_single_resource_object(self):
+        self.assertEqual(self.scan(' {"data": {"type": "people"}} '), [{'type': 'people'}])
+
+    def test_keeps_memory_bounded(self):
+        document = ujson.dumps({'data': [{'type': 'people', 'attributes': {'bio': 'x' * 100}}] * 1000})
+        scanner = PrimaryDataScanner(io.BytesIO(document.encode('utf-8')), 1024)
+
+        for _ in scanner:
+            self.assertLess(len(scanner.buffer), 3 * 1024)
+
+    def test_drops_read_text_once_per_chunk(self):
+        """
+        The buffer is copied to drop the text read before the current position about once per chunk read, rather
+        than once per token, which would make scanning quadratic in the chunk size.
+        """
+        class CountingScanner(PrimaryDataScanner):
+            copies = 0
+
+            def discard(self):
+                buffer = self.buffer
+                super(CountingScanner, self).discard()
+                if self.buffer is not buffer:
+                    self.copies += 1
+
+        document = ujson.dumps({'data': [{'type': 'people', 'attributes': {'bio': 'x' * 100}}] * 1000})
+        scanner = CountingScanner(io.BytesIO(document.encode('utf-8')), 1024)
+
+        self.assertEqual(len(list(scanner)), 1000)
+        self.assertLessEqual(scanner.copies, len(document) // 1024 + 1)
+
+    def test_malformed_documents(self):
+        for document in ('', '[]', '{"data" []}', '{"data": [1,]}', '{"data": [1 2]}', '{"data": [{"a": 1}',
+                         '{"data": [], "meta": "'):
+            with self.assertRaises(ParseError):
+                self.scan(document)
+
+
+class StreamingJSONParserTestCase(TestCase):
+    def test_parse__is_lazy(self):
+        parser_context = {'view': Mock(resource_name='people'), 'request': Mock(method='POST')}
+        document = '{"data": [{"type": "people", "attributes": {"firstName": "John"}}, {"type": "companies"}]}'
+
+        resource_objects = StreamingJSONParser().parse(io.BytesIO(document.encode('utf-8')),
+                                                       parser_context=parser_context)
+
+        self.assertEqual(next(resource_objects), {'id': None, 'first_name': 'John'})
+        with self.assertRaises(Conflict):
+            next(resource_objects)
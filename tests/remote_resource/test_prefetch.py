@@ -0,0 +1,199 @@
+from unittest import TestCase
+
+from django.db import models
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from tests.remote_resource.db import ModelTablesTestCase
+from zc_common.remote_resource.models import RemoteForeignKey
+from zc_common.remote_resource.prefetch import clear_prefetch_lookups, get_only_fields, get_prefetch_lookups
+from zc_common.remote_resource.relations import RemoteResourceField
+from zc_common.remote_resource.views import ModelViewSet
+
+
+class PrefetchCountry(models.Model):
+    name = models.TextField()
+
+    class Meta:
+        app_label = 'tests'
+
+
+class PrefetchCity(models.Model):
+    country = models.ForeignKey(PrefetchCountry)
+
+    class Meta:
+        app_label = 'tests'
+
+
+class PrefetchTag(models.Model):
+    city = models.ForeignKey(PrefetchCity)
+
+    class Meta:
+        app_label = 'tests'
+
+
+class PrefetchPerson(models.Model):
+    home_city = models.ForeignKey(PrefetchCity)
+    tags = models.ManyToManyField(PrefetchTag)
+    company = RemoteForeignKey('Company')
+
+    class Meta:
+        app_label = 'tests'
+
+
+class PrefetchPet(models.Model):
+    owner = models.ForeignKey(PrefetchPerson, related_name='pet_set')
+
+    class Meta:
+        app_label = 'tests'
+
+
+class CountrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PrefetchCountry
+        fields = ('name',)
+
+
+class CitySerializer(serializers.ModelSerializer):
+    included_serializers = {'country': CountrySerializer}
+
+    class Meta:
+        model = PrefetchCity
+        fields = ('country',)
+
+
+class TagSerializer(serializers.ModelSerializer):
+    included_serializers = {'city': CitySerializer}
+
+    class Meta:
+        model = PrefetchTag
+        fields = ('city',)
+
+
+class PetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PrefetchPet
+        fields = ('owner',)
+
+
+class PersonSerializer(serializers.ModelSerializer):
+    pet_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    company = RemoteResourceField(related_resource_path='/companies/{pk}', read_only=True)
+
+    included_serializers = {
+        'home_city': CitySerializer,
+        'tags': TagSerializer,
+        'pet_set': PetSerializer,
+    }
+
+    class Meta:
+        model = PrefetchPerson
+        fields = ('home_city', 'tags', 'pet_set', 'company')
+
+
+class RequestSerializerMixin(object):
+    def __init__(self, *args, **kwargs):
+        super(RequestSerializerMixin, self).__init__(*args, **kwargs)
+        self.request = self.context['request']
+
+
+class RequestCitySerializer(RequestSerializerMixin, CitySerializer):
+    class Meta(CitySerializer.Meta):
+        pass
+
+
+class RequestPersonSerializer(RequestSerializerMixin, PersonSerializer):
+    included_serializers = dict(PersonSerializer.included_serializers, home_city=RequestCitySerializer)
+
+    class Meta(PersonSerializer.Meta):
+        pass
+
+
+class PersonViewSet(ModelViewSet):
+    queryset = PrefetchPerson.objects.all()
+    serializer_class = RequestPersonSerializer
+    filter_backends = ()
+
+
+def get_view(query_params):
+    view = PersonViewSet(action='list', format_kwarg=None)
+    view.request = Request(APIRequestFactory().get('/people/', query_params))
+    return view
+
+
+class GetPrefetchLookupsTestCase(TestCase):
+    def setUp(self):
+        clear_prefetch_lookups()
+
+    def test_single_valued_paths_are_joined(self):
+        lookups = get_prefetch_lookups(PrefetchPerson, PersonSerializer, ['homeCity', 'homeCity.country'])
+        self.assertEqual(lookups, (['home_city__country'], []))
+
+    def test_multi_valued_paths_are_prefetched(self):
+        lookups = get_prefetch_lookups(PrefetchPerson, PersonSerializer, ['tags.city.country', 'petSet'])
+        self.assertEqual(lookups, ([], ['pet_set', 'tags__city__country']))
+
+    def test_remote_resources_are_skipped(self):
+        lookups = get_prefetch_lookups(PrefetchPerson, PersonSerializer, ['company', 'unknown'])
+        self.assertEqual(lookups, ([], []))
+
+    def test_serializers_get_the_context(self):
+        lookups = get_prefetch_lookups(
+            PrefetchPerson, RequestPersonSerializer, ['homeCity.country', 'tags'], {'request': None})
+        self.assertEqual(lookups, (['home_city__country'], ['tags']))
+
+    def test_view_passes_the_serializer_context(self):
+        view = get_view({'include': 'homeCity.country,tags'})
+
+        queryset = view.filter_queryset(view.get_queryset())
+
+        self.assertEqual(queryset.query.select_related, {'home_city': {'country': {}}})
+        self.assertEqual(list(queryset._prefetch_related_lookups), ['tags'])
+
+
+class PrefetchIncludedQueriesTestCase(ModelTablesTestCase):
+    models = (PrefetchCountry, PrefetchCity, PrefetchTag, PrefetchPerson, PrefetchPet)
+
+    @classmethod
+    def setUpTestData(cls):
+        city = PrefetchCity.objects.create(country=PrefetchCountry.objects.create(name='USA'))
+        tags = [PrefetchTag.objects.create(city=city) for _ in range(2)]
+        for _ in range(10):
+            PrefetchPerson.objects.create(home_city=city, company='1').tags.add(*tags)
+
+    def setUp(self):
+        clear_prefetch_lookups()
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for page_size in (2, 10):
+            view = get_view({'include': 'homeCity.country,tags'})
+
+            # The people with their city and its country, then their tags
+            with self.assertNumQueries(2):
+                people = list(view.filter_queryset(view.get_queryset())[:page_size])
+                for person in people:
+                    self.assertEqual(person.home_city.country.name, 'USA')
+                    self.assertEqual(len(person.tags.all()), 2)
+
+            self.assertEqual(len(people), page_size)
+
+
+class GetOnlyFieldsTestCase(TestCase):
+    def test_serializer_gets_the_context(self):
+        self.assertEqual(get_only_fields(PrefetchPerson, RequestPersonSerializer, ['home_city'], {'request': None}),
+                         ['id', 'home_city'])
+
+    def test_maps_serializer_fields_to_columns(self):
+        self.assertEqual(get_only_fields(PrefetchPerson, PersonSerializer, ['home_city', 'tags', 'company']),
+                         ['id', 'home_city', 'company'])
+
+    def test_fields_without_model_field(self):
+        class PersonWithNameSerializer(PersonSerializer):
+            name = serializers.SerializerMethodField()
+
+            class Meta(PersonSerializer.Meta):
+                fields = PersonSerializer.Meta.fields + ('name',)
+
+        self.assertEqual(get_only_fields(PrefetchPerson, PersonWithNameSerializer, ['pet_set']), ['id'])
+        self.assertIsNone(get_only_fields(PrefetchPerson, PersonWithNameSerializer, ['pet_set', 'name']))
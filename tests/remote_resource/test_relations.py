@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from mock import Mock, PropertyMock, patch
+from rest_framework import serializers
+
+from zc_common.remote_resource.relations import RemoteResourceField
+
+
+class FakeQuerySet(list):
+    def __init__(self, items, evaluated):
+        super(FakeQuerySet, self).__init__(items)
+        self._result_cache = items if evaluated else None
+
+
+class GetRelatedIdsTestCase(TestCase):
+    def setUp(self):
+        self.field = RemoteResourceField(related_resource_path='/addresses/{pk}', read_only=True)
+        self.manager = Mock()
+        self.manager.values_list.return_value = [7]
+
+    def test_reads_prefetched_objects(self):
+        self.manager.all.return_value = FakeQuerySet([Mock(pk=1), Mock(pk=2)], evaluated=True)
+
+        self.assertEqual(self.field.get_related_ids(Mock(pk=1), self.manager), [1, 2])
+        self.assertFalse(self.manager.values_list.called)
+
+    def test_reads_ids_loaded_for_the_page(self):
+        self.manager.all.return_value = FakeQuerySet([], evaluated=False)
+
+        with patch.object(self.field, 'get_page_related_ids', return_value={1: [3, 4]}):
+            self.assertEqual(self.field.get_related_ids(Mock(pk=1), self.manager), [3, 4])
+            self.assertFalse(self.manager.values_list.called)
+
+            # Resources that are not on the page, such as included ones, load their own ids
+            self.assertEqual(self.field.get_related_ids(Mock(pk=2), self.manager), [7])
+
+    def test_page_ids_are_loaded_through_the_related_manager(self):
+        class Resource(object):
+            def __init__(self, pk):
+                self.pk = pk
+
+        resources = [Resource(1), Resource(2)]
+        model_field = Mock(is_relation=True, auto_created=True, concrete=False)
+        model_field.field.name = 'owner'
+        related_manager = model_field.related_model._default_manager
+        related_manager.filter.return_value.values_list.return_value = [(1, 10), (1, 11)]
+        self.field.source = 'pets'
+
+        root = serializers.ListSerializer(resources, child=serializers.Serializer())
+        with patch.object(RemoteResourceField, 'root', new_callable=PropertyMock, return_value=root), \
+                patch('zc_common.remote_resource.relations.get_model_field', return_value=model_field):
+            self.assertEqual(self.field.get_page_related_ids(resources[0]), {1: [10, 11], 2: []})
+
+        related_manager.filter.assert_called_once_with(owner__in=[1, 2])
+        related_manager.filter.return_value.values_list.assert_called_once_with('owner', 'pk')
@@ -0,0 +1,203 @@
+import os
+from collections import OrderedDict
+from unittest import TestCase
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from mock import Mock, patch
+from rest_framework import serializers
+
+import tests
+
+# The renderers module looks up the event client on the root module of the Django settings
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+tests.event_client = Mock()
+
+from zc_common.remote_resource import utils  # noqa: E402
+from zc_common.remote_resource.renderers import JSONRenderer, SerializerPlan  # noqa: E402
+
+
+class Resource(object):
+    def __init__(self, pk, **kwargs):
+        self.pk = pk
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class CitySerializer(serializers.Serializer):
+    city_name = serializers.CharField()
+    zip_code = serializers.CharField()
+
+    class JSONAPIMeta:
+        resource_name = 'city'
+
+
+class AddressSerializer(serializers.Serializer):
+    street_name = serializers.CharField()
+    street_number = serializers.IntegerField()
+    city = CitySerializer()
+
+    class JSONAPIMeta:
+        resource_name = 'address'
+
+
+class PersonSerializer(serializers.Serializer):
+    first_name = serializers.CharField()
+    home_address = AddressSerializer()
+
+    class JSONAPIMeta:
+        resource_name = 'person'
+
+
+class AccountSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    url = serializers.HyperlinkedIdentityField(view_name='account-detail')
+    email = serializers.EmailField()
+    password = serializers.CharField(write_only=True)
+    created = serializers.DateTimeField(read_only=True)
+    owner = PersonSerializer()
+
+    class JSONAPIMeta:
+        resource_name = 'account'
+
+
+def build_json_resource_obj(cls, fields, resource, resource_instance, resource_name):
+    return OrderedDict([
+        ('type', resource_name),
+        ('id', str(resource_instance.pk)),
+        ('attributes', cls.extract_attributes(fields, resource)),
+    ])
+
+
+@override_settings(JSON_API_FORMAT_FIELD_NAMES='camelize')
+class ExtractIncludedTestCase(SimpleTestCase):
+    def setUp(self):
+        utils._formatted_keys.clear()
+
+    def get_people(self, count):
+        return [
+            Resource(pk, first_name='John', home_address=Resource(
+                pk, street_name='Main', street_number=pk, city=Resource(pk, city_name='Oakland', zip_code='94607')))
+            for pk in range(count)
+        ]
+
+    def extract_included(self, people):
+        included = []
+        for person in people:
+            serializer = PersonSerializer(person)
+            included.extend(JSONRenderer.extract_included(
+                Mock(), serializer.fields, serializer.data, person, ['homeAddress', 'homeAddress.city'],
+                remote_includes=Mock()))
+        return included
+
+    def test_included_documents_are_formatted(self):
+        with patch.object(JSONRenderer, 'build_json_resource_obj', classmethod(build_json_resource_obj)):
+            included = self.extract_included(self.get_people(1))
+
+        self.assertEqual([(item['type'], list(item['attributes'])) for item in included], [
+            ('address', ['streetName', 'streetNumber']),
+            ('city', ['cityName', 'zipCode']),
+        ])
+
+    def test_keys_are_formatted_once(self):
+        """
+        Each key of the included documents is formatted exactly once, however deep the document is included, so
+        the formatting work grows linearly with the size of the output.
+        """
+        for count in (1, 10, 100):
+            with patch.object(JSONRenderer, 'build_json_resource_obj', classmethod(build_json_resource_obj)), \
+                    patch('zc_common.remote_resource.utils.format_key', wraps=utils.format_key) as format_key:
+                included = self.extract_included(self.get_people(count))
+
+            formatted_keys = sum(len(item['attributes']) for item in included)
+            self.assertEqual(formatted_keys, 4 * count)
+            self.assertEqual(format_key.call_count, formatted_keys)
+
+    def test_shared_resources_are_serialized_once(self):
+        city = Resource(1, city_name='Oakland', zip_code='94607')
+        address = Resource(1, street_name='Main', street_number=1, city=city)
+        people = [Resource(pk, first_name='John', home_address=address) for pk in range(50)]
+
+        included_keys = set()
+        with patch.object(JSONRenderer, 'build_json_resource_obj', classmethod(build_json_resource_obj)):
+            with patch.object(JSONRenderer, 'extract_included', wraps=JSONRenderer.extract_included) as extract:
+                included = []
+                for person in people:
+                    serializer = PersonSerializer(person)
+                    included.extend(JSONRenderer.extract_included(
+                        Mock(), serializer.fields, serializer.data, person, ['homeAddress', 'homeAddress.city'],
+                        remote_includes=Mock(), included_keys=included_keys))
+
+        self.assertEqual([(item['type'], item['id']) for item in included], [('address', '1'), ('city', '1')])
+        # One call per person, plus a single one extracting the city of the shared address
+        self.assertEqual(extract.call_count, 51)
+
+
+class SerializerPlanTestCase(TestCase):
+    def setUp(self):
+        SerializerPlan._plans.clear()
+
+    def tearDown(self):
+        SerializerPlan._plans.clear()
+
+    def test_plan_is_reused_for_serializer_class(self):
+        plan = SerializerPlan.for_fields(AccountSerializer().fields)
+
+        self.assertIs(SerializerPlan.for_fields(AccountSerializer().fields), plan)
+        self.assertIsNot(SerializerPlan.for_fields(PersonSerializer().fields), plan)
+        self.assertEqual(len(SerializerPlan._plans), 2)
+
+    def test_plan_matches_uncached_field_split(self):
+        fields = AccountSerializer().fields
+        plan = SerializerPlan.for_fields(fields)
+        uncached = SerializerPlan(fields)
+
+        self.assertEqual(plan.attribute_fields, [('email', False), ('created', True)])
+        self.assertEqual(plan.relation_fields, ['owner'])
+        self.assertEqual(plan.attribute_fields, uncached.attribute_fields)
+        self.assertEqual(plan.relation_fields, uncached.relation_fields)
+        self.assertEqual(plan.resource_type, 'account')
+
+    def test_plans_are_reset_at_bound(self):
+        with patch.object(SerializerPlan, 'max_plans', 2):
+            SerializerPlan.for_fields(CitySerializer().fields)
+            SerializerPlan.for_fields(AddressSerializer().fields)
+            self.assertEqual(len(SerializerPlan._plans), 2)
+
+            plan = SerializerPlan.for_fields(PersonSerializer().fields)
+
+        self.assertEqual(list(SerializerPlan._plans.values()), [plan])
+
+
+class ApplySparseFieldsetTestCase(TestCase):
+    def test_keeps_requested_fields(self):
+        resource_obj = {
+            'type': 'person', 'id': '1',
+            'attributes': OrderedDict([('firstName', 'John'), ('lastName', 'Doe')]),
+            'relationships': OrderedDict([('homeAddress', {}), ('company', {})]),
+        }
+
+        sparse = JSONRenderer.apply_sparse_fieldset(resource_obj, {'person': {'firstName', 'company'}})
+
+        self.assertEqual(sparse['attributes'], {'firstName': 'John'})
+        self.assertEqual(list(sparse['relationships']), ['company'])
+        # Remote documents may be cached, so the resource object itself is left untouched
+        self.assertEqual(list(resource_obj['attributes']), ['firstName', 'lastName'])
+        self.assertIs(JSONRenderer.apply_sparse_fieldset(resource_obj, {'city': {'cityName'}}), resource_obj)
+
+
+class RecordRemoteIncludeStatsTestCase(TestCase):
+    def record(self, stats_in_meta, stats):
+        meta = {}
+        renderer = JSONRenderer()
+        remote_includes = Mock(**{'stats.return_value': stats})
+        with patch('zc_common.remote_resource.renderers.zc_settings', REMOTE_INCLUDE_STATS_IN_META=stats_in_meta):
+            renderer.record_remote_include_stats(remote_includes, meta)
+
+        self.assertEqual(renderer.remote_include_stats, stats)
+        return meta
+
+    def test_stats_in_meta(self):
+        self.assertEqual(self.record(True, {'hits': 2, 'misses': 1}), {'remote_includes': {'hits': 2, 'misses': 1}})
+        self.assertEqual(self.record(True, {'hits': 0, 'misses': 0}), {})
+        self.assertEqual(self.record(False, {'hits': 2, 'misses': 1}), {})
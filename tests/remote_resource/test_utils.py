@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from zc_common.remote_resource import utils
+
+
+class FormatKeysTestCase(TestCase):
+    def setUp(self):
+        utils._formatted_keys.clear()
+
+    def test_format_keys(self):
+        data = {'first_name': 'John', 'home_address': {'zip_code': '94107'}, 'phone_numbers': [{'area_code': 415}]}
+
+        self.assertEqual(utils.format_keys(data, 'camelize'), {
+            'firstName': 'John', 'homeAddress': {'zipCode': '94107'}, 'phoneNumbers': [{'areaCode': 415}]})
+        self.assertEqual(utils.format_keys(data, 'dasherize'), {
+            'first-name': 'John', 'home-address': {'zip-code': '94107'}, 'phone-numbers': [{'area-code': 415}]})
+        self.assertEqual(utils.format_keys({'firstName': 'John'}, 'underscore'), {'first_name': 'John'})
+        self.assertEqual(utils.format_keys({'first_name': 'John'}, 'capitalize'), {'FirstName': 'John'})
+        self.assertIs(utils.format_keys(data, False), data)
+
+    def test_format_keys__memoizes_formatted_keys(self):
+        data = [{'first_name': 'John', 'last_name': 'Coltrane'} for _ in range(100)]
+
+        with patch('zc_common.remote_resource.utils.inflection.camelize',
+                   side_effect=lambda key, upper: key.title().replace('_', '')) as camelize:
+            utils.format_keys(data, 'camelize')
+
+        self.assertEqual(camelize.call_count, 2)
+
+
+class SparseFieldsetsTestCase(TestCase):
+    def test_get_sparse_fieldsets(self):
+        request = Mock(query_params={'fields[people]': 'firstName,homeAddress', 'fields[cities]': '', 'page': '2'})
+
+        self.assertEqual(utils.get_sparse_fieldsets(request),
+                         {'people': {'firstName', 'homeAddress'}, 'cities': set()})
+        self.assertEqual(utils.get_sparse_fieldsets(None), {})
+
+    def test_get_sparse_field_names(self):
+        field_names = utils.get_sparse_field_names({'firstName'}, ['homeAddress.city'])
+
+        self.assertEqual(field_names, {'first_name', 'home_address', 'id', 'url'})
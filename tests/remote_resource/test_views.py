@@ -0,0 +1,406 @@
+import json
+import os
+from unittest import TestCase
+
+from django.db import models
+from django.http import StreamingHttpResponse
+from mock import Mock, patch
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser as DRFJSONParser
+from rest_framework.renderers import JSONRenderer as DRFJSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_json_api.relations import ResourceRelatedField
+
+import tests
+from tests.remote_resource.db import ModelTablesTestCase
+from zc_common.jwt_auth.permissions import BasePermission
+from zc_common.remote_resource.filters import JSONAPIFilterBackend, clear_filter_plans
+from zc_common.remote_resource.models import RemoteForeignKey
+from zc_common.remote_resource.pagination import PageNumberPagination
+from zc_common.remote_resource.views import (
+    ModelViewSet, clear_filter_fields, clone_query_request, get_collection_path, get_filter_fields, get_query_params,
+    iterate_in_slices)
+
+# The renderers module looks up the event client on the root module of the Django settings
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+tests.event_client = Mock()
+
+from zc_common.remote_resource.renderers import JSONRenderer  # noqa: E402
+
+
+class ViewItem(models.Model):
+    name = models.CharField(max_length=50)
+    quantity = models.IntegerField()
+    owner = RemoteForeignKey('User')
+
+    class Meta:
+        app_label = 'tests'
+
+
+class ItemViewSet(ModelViewSet):
+    queryset = ViewItem.objects.all()
+
+
+class ItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ViewItem
+        fields = ('id', 'name', 'quantity')
+
+
+class ReadOnlyPermission(BasePermission):
+    def has_read_permission(self, request, view):
+        return True
+
+
+class QueryItemViewSet(ItemViewSet):
+    queryset = ViewItem.objects.order_by('pk')
+    serializer_class = ItemSerializer
+    permission_classes = (ReadOnlyPermission,)
+    renderer_classes = (DRFJSONRenderer,)
+    filter_backends = (JSONAPIFilterBackend,)
+    pagination_class = PageNumberPagination
+
+
+class BulkTag(models.Model):
+    name = models.CharField(max_length=50)
+
+    class Meta:
+        app_label = 'tests'
+
+
+class BulkItem(models.Model):
+    name = models.CharField(max_length=50)
+    quantity = models.IntegerField()
+    tags = models.ManyToManyField(BulkTag, blank=True)
+
+    class Meta:
+        app_label = 'tests'
+
+
+class BulkItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BulkItem
+        fields = ('id', 'name', 'quantity', 'tags')
+
+
+class BulkItemViewSet(ModelViewSet):
+    queryset = BulkItem.objects.order_by('pk')
+    serializer_class = BulkItemSerializer
+    parser_classes = (DRFJSONParser,)
+    renderer_classes = (DRFJSONRenderer,)
+    filter_backends = ()
+    pagination_class = None
+    allow_bulk_writes = True
+
+
+class StreamCategory(models.Model):
+    name = models.CharField(max_length=50)
+
+    class Meta:
+        app_label = 'tests'
+
+
+class StreamItem(models.Model):
+    name = models.CharField(max_length=50)
+    category = models.ForeignKey(StreamCategory)
+
+    class Meta:
+        app_label = 'tests'
+
+
+class StreamCategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StreamCategory
+        fields = ('name',)
+
+
+class StreamItemSerializer(serializers.ModelSerializer):
+    included_serializers = {'category': StreamCategorySerializer}
+
+    category = ResourceRelatedField(read_only=True)
+
+    class Meta:
+        model = StreamItem
+        fields = ('name', 'category')
+
+
+class StreamItemViewSet(ModelViewSet):
+    queryset = StreamItem.objects.order_by('pk')
+    serializer_class = StreamItemSerializer
+    renderer_classes = (JSONRenderer,)
+    filter_backends = ()
+    pagination_class = PageNumberPagination
+    stream_list_responses = True
+
+
+def view_request(method, path, data=None, **kwargs):
+    request = getattr(APIRequestFactory(), method)(path, data, **kwargs)
+    force_authenticate(request, user=Mock(roles=['user']))
+    return request
+
+
+class FilterFieldsTestCase(TestCase):
+    def setUp(self):
+        clear_filter_fields()
+
+    def test_filter_fields(self):
+        self.assertEqual(ItemViewSet().filter_fields, {
+            'id': ['in', 'exact'],
+            'name': ['icontains', 'exact'],
+            'quantity': ['exact'],
+            'owner': ['icontains', 'exact'],
+        })
+
+    def test_filter_fields_are_computed_once_per_model(self):
+        with patch.object(ViewItem._meta, 'get_fields', wraps=ViewItem._meta.get_fields) as get_fields:
+            for _ in range(3):
+                ItemViewSet().filter_fields['extra'] = ['exact']
+
+        self.assertEqual(get_fields.call_count, 1)
+        self.assertNotIn('extra', get_filter_fields(ViewItem))
+
+
+class GetQueryParamsTestCase(TestCase):
+    def test_translates_body_into_query_params(self):
+        query_params = get_query_params({
+            'filter': {'id__in': [1, 2, 3], 'active': True},
+            'fields': {'item': ['name']},
+            'include': 'owner',
+            'page': 2,
+            'sort': None,
+        })
+
+        self.assertEqual(query_params.dict(), {
+            'filter[id__in]': '1,2,3',
+            'filter[active]': 'true',
+            'fields[item]': 'name',
+            'include': 'owner',
+            'page': '2',
+        })
+
+    def test_invalid_body(self):
+        for body in ([], {'filter': 'id__in=1'}):
+            with self.assertRaises(ParseError):
+                get_query_params(body)
+
+
+class GetCollectionPathTestCase(TestCase):
+    def test_strips_the_action(self):
+        self.assertEqual(get_collection_path('/api/people/query/'), '/api/people/')
+        self.assertEqual(get_collection_path('/api/people/query'), '/api/people')
+        self.assertEqual(get_collection_path('/api/people/'), '/api/people/')
+
+
+class CloneQueryRequestTestCase(TestCase):
+    def test_leaves_the_request_untouched(self):
+        request = Request(APIRequestFactory().post('/api/people/query/?page=3', {}, format='json'))
+
+        query_request = clone_query_request(request, get_query_params({'page': 2}), '/api/people/')
+
+        self.assertEqual(query_request.method, 'GET')
+        self.assertEqual(query_request.query_params.dict(), {'page': '2'})
+        self.assertEqual(query_request.build_absolute_uri(), 'http://testserver/api/people/?page=2')
+        self.assertEqual(request.method, 'POST')
+        self.assertEqual(request.query_params.dict(), {'page': '3'})
+        self.assertEqual(request.build_absolute_uri(), 'http://testserver/api/people/query/?page=3')
+
+
+class QueryViewTestCase(ModelTablesTestCase):
+    models = (ViewItem,)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [ViewItem.objects.create(name='Item {}'.format(index), quantity=index) for index in range(5)]
+
+    def setUp(self):
+        clear_filter_plans()
+
+    def test_query(self):
+        ids = [item.pk for item in self.items[1:4]]
+        request = view_request('post', '/items/query/', {'filter': {'id__in': ids}, 'page_size': 2}, format='json')
+
+        response = QueryItemViewSet.as_view({'post': 'query'})(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], ids[:2])
+        self.assertEqual(response.data['meta']['pagination'], {'page': 1, 'pages': 2, 'count': 3})
+        self.assertTrue(response.data['links']['next'].startswith('http://testserver/items/?'))
+        self.assertIn('page=2', response.data['links']['next'])
+
+    def test_query_is_checked_as_a_read(self):
+        request = view_request('post', '/items/query/', {'page_size': 2}, format='json')
+        self.assertEqual(QueryItemViewSet.as_view({'post': 'query'})(request).status_code, 200)
+
+        request = view_request('post', '/items/', {'name': 'Item', 'quantity': 1}, format='json')
+        self.assertEqual(QueryItemViewSet.as_view({'post': 'create'})(request).status_code, 403)
+
+
+class BulkWritesTestCase(ModelTablesTestCase):
+    models = (BulkTag, BulkItem)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [BulkTag.objects.create(name='Tag {}'.format(index)) for index in range(2)]
+
+    def create(self, data, view_class=BulkItemViewSet):
+        request = view_request('post', '/items/', data, format='json')
+        return view_class.as_view({'post': 'create'})(request)
+
+    def bulk_update(self, data, view_class=BulkItemViewSet):
+        request = view_request('patch', '/items/bulk/', data, format='json')
+        return view_class.as_view({'patch': 'bulk_update'})(request)
+
+    def test_create(self):
+        tag_ids = [tag.pk for tag in self.tags]
+        with patch.object(BulkItem, 'save', autospec=True, side_effect=BulkItem.save) as save:
+            response = self.create([
+                {'name': 'Apple', 'quantity': 1, 'tags': tag_ids},
+                {'name': 'Pear', 'quantity': 2, 'tags': []},
+            ])
+
+        self.assertEqual(response.status_code, 201)
+        # SQLite can't return the ids of a bulk insert, so each resource is saved to get its id
+        self.assertEqual(save.call_count, 2)
+        items = list(BulkItem.objects.order_by('pk'))
+        self.assertEqual([item['id'] for item in response.data], [item.pk for item in items])
+        self.assertEqual([(item.name, item.quantity) for item in items], [('Apple', 1), ('Pear', 2)])
+        self.assertEqual(sorted(items[0].tags.values_list('pk', flat=True)), tag_ids)
+        self.assertEqual(list(items[1].tags.all()), [])
+
+    def test_create__bulk_insert(self):
+        class UntaggedItemSerializer(BulkItemSerializer):
+            class Meta(BulkItemSerializer.Meta):
+                fields = ('id', 'name', 'quantity')
+
+        class UntaggedItemViewSet(BulkItemViewSet):
+            # The many-to-many relations of resources inserted without their ids can't be read
+            serializer_class = UntaggedItemSerializer
+
+        with patch('zc_common.remote_resource.serializers.can_return_ids_from_bulk_insert', return_value=True), \
+                patch.object(BulkItem._default_manager, 'bulk_create',
+                             wraps=BulkItem._default_manager.bulk_create) as bulk_create:
+            response = self.create(
+                [{'name': 'Apple', 'quantity': 1}, {'name': 'Pear', 'quantity': 2}], UntaggedItemViewSet)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(bulk_create.call_count, 1)
+        self.assertEqual(sorted(BulkItem.objects.values_list('name', flat=True)), ['Apple', 'Pear'])
+
+    def test_create__invalid_resource(self):
+        response = self.create([{'name': 'Apple', 'quantity': 1}, {'name': 'Pear', 'quantity': 'many'}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('quantity', response.data[1])
+        self.assertFalse(BulkItem.objects.exists())
+
+    def test_update(self):
+        items = [BulkItem.objects.create(name=name, quantity=1) for name in ('Apple', 'Pear')]
+        tag_ids = [tag.pk for tag in self.tags]
+
+        with patch.object(BulkItem, 'save', autospec=True, side_effect=BulkItem.save) as save:
+            response = self.bulk_update([
+                {'id': items[0].pk, 'quantity': 5, 'tags': tag_ids},
+                {'id': items[1].pk, 'name': 'Plum'},
+            ])
+
+        self.assertEqual(response.status_code, 200)
+        # Django < 2.2 has no bulk_update(), so only the fields of each resource are saved
+        self.assertEqual([call[1] for call in save.call_args_list],
+                         [{'update_fields': ['quantity']}, {'update_fields': ['name']}])
+        self.assertEqual([(item['name'], item['quantity']) for item in response.data], [('Apple', 5), ('Plum', 1)])
+        self.assertEqual(list(BulkItem.objects.order_by('pk').values_list('name', 'quantity')),
+                         [('Apple', 5), ('Plum', 1)])
+        self.assertEqual(sorted(items[0].tags.values_list('pk', flat=True)), tag_ids)
+
+    def test_update__bulk_update(self):
+        items = [BulkItem.objects.create(name=name, quantity=1) for name in ('Apple', 'Pear')]
+
+        with patch.object(BulkItem._default_manager, 'bulk_update', create=True) as bulk_update:
+            response = self.bulk_update([{'id': items[0].pk, 'quantity': 5}, {'id': items[1].pk, 'quantity': 6}])
+
+        self.assertEqual(response.status_code, 200)
+        bulk_update.assert_called_once_with(items, ['quantity'], batch_size=500)
+        self.assertEqual([item.quantity for item in bulk_update.call_args[0][0]], [5, 6])
+
+    def test_update__unknown_or_missing_id(self):
+        item = BulkItem.objects.create(name='Apple', quantity=1)
+
+        response = self.bulk_update([{'id': item.pk, 'quantity': 5}, {'id': item.pk + 1, 'quantity': 6}, {}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+        self.assertIn('id', response.data[2])
+        self.assertEqual(BulkItem.objects.get().quantity, 1)
+
+    def test_bulk_writes_not_allowed(self):
+        class ReadOnlyItemViewSet(BulkItemViewSet):
+            allow_bulk_writes = False
+
+        item = BulkItem.objects.create(name='Apple', quantity=1)
+
+        self.assertEqual(self.create([{'name': 'Pear', 'quantity': 2}], ReadOnlyItemViewSet).status_code, 400)
+        self.assertEqual(self.bulk_update([{'id': item.pk, 'quantity': 5}], ReadOnlyItemViewSet).status_code, 400)
+        self.assertEqual(list(BulkItem.objects.values_list('name', 'quantity')), [('Apple', 1)])
+
+
+class StreamListResponsesTestCase(ModelTablesTestCase):
+    models = (StreamCategory, StreamItem)
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [StreamCategory.objects.create(name='Category {}'.format(index)) for index in range(3)]
+        for index in range(7):
+            StreamItem.objects.create(name='Item {}'.format(index), category=categories[index % 3])
+
+    def get_document(self, query_params, **attrs):
+        view_class = type('ItemViewSet', (StreamItemViewSet,), attrs)
+        response = view_class.as_view({'get': 'list'})(view_request('get', '/items/', query_params))
+
+        self.assertEqual(response.status_code, 200)
+        if isinstance(response, StreamingHttpResponse):
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.render().content
+        return isinstance(response, StreamingHttpResponse), json.loads(content.decode('utf-8'))
+
+    def test_streamed_document_matches_rendered_document(self):
+        for query_params, attrs in (
+                ({'include': 'category', 'page_size': 2, 'page': 2}, {}),
+                ({'include': 'category'}, {'pagination_class': None}),
+                ({}, {'pagination_class': None})):
+            streamed, document = self.get_document(query_params, **attrs)
+            rendered, expected = self.get_document(query_params, stream_list_responses=False, **attrs)
+
+            self.assertTrue(streamed)
+            self.assertFalse(rendered)
+            self.assertEqual(document, expected)
+
+        _, document = self.get_document({'include': 'category', 'page_size': 2, 'page': 2})
+        self.assertEqual([resource['attributes']['name'] for resource in document['data']], ['Item 2', 'Item 3'])
+        self.assertEqual([resource['attributes']['name'] for resource in document['included']],
+                         ['Category 0', 'Category 2'])
+        self.assertEqual(document['meta']['pagination'], {'page': 2, 'pages': 4, 'count': 7})
+        self.assertEqual(sorted(document['links']), ['first', 'last', 'next', 'prev', 'self'])
+
+    def test_renderers_without_streaming_are_not_streamed(self):
+        streamed, document = self.get_document({'page_size': 2}, renderer_classes=(DRFJSONRenderer,))
+
+        self.assertFalse(streamed)
+        self.assertEqual([resource['name'] for resource in document['results']], ['Item 0', 'Item 1'])
+
+
+class IterateInSlicesTestCase(TestCase):
+    def test_loads_one_slice_at_a_time(self):
+        slices = []
+
+        class Sliceable(list):
+            def __getitem__(self, key):
+                slices.append((key.start, key.stop))
+                return list.__getitem__(self, key)
+
+        self.assertEqual(list(iterate_in_slices(Sliceable(range(5)), 2)), [0, 1, 2, 3, 4])
+        self.assertEqual(slices, [(0, 2), (2, 4), (4, 6)])
@@ -0,0 +1,43 @@
+import time
+from unittest import TestCase
+
+from zc_common.cache import LRUCache
+
+
+class TestLRUCache(TestCase):
+
+    def test_get__missing_key(self):
+        cache = LRUCache()
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.get('key', 'default'), 'default')
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_expires_items(self):
+        cache = LRUCache(ttl=0.05)
+        cache.set('a', 1)
+        cache.set('b', 2, timeout=10)
+        time.sleep(0.1)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+
+    def test_add(self):
+        cache = LRUCache()
+        self.assertTrue(cache.add('a', 1))
+        self.assertFalse(cache.add('a', 2))
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.delete('a')
+        self.assertTrue(cache.add('a', 3))
+        self.assertEqual(cache.get('a'), 3)
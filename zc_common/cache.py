@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    A thread safe, in-process cache holding at most `max_entries` items. The least recently used item is
+    evicted first once the cache is full. Items expire after `ttl` seconds, unless a different timeout is
+    given when setting them; a timeout of None keeps the item until it is evicted.
+    """
+
+    def __init__(self, max_entries=1000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires_at = self._data.pop(key)
+            except KeyError:
+                return default
+
+            if expires_at is not None and expires_at <= time.time():
+                return default
+
+            # Re-insert the item to mark it as the most recently used one
+            self._data[key] = (value, expires_at)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.ttl if timeout is None else timeout
+        expires_at = time.time() + timeout if timeout is not None else None
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires_at)
+
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, timeout=None):
+        """
+        Sets the item only if the cache does not hold an unexpired value for the key yet. Returns whether the
+        item was set.
+        """
+        timeout = self.ttl if timeout is None else timeout
+        expires_at = time.time() + timeout if timeout is not None else None
+
+        with self._lock:
+            if key in self._data:
+                current_expires_at = self._data[key][1]
+                if current_expires_at is None or current_expires_at > time.time():
+                    return False
+                del self._data[key]
+
+            self._data[key] = (value, expires_at)
+
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -1,3 +1,8 @@
+import copy
+import numbers
+import threading
+import time
+
 import jwt
 from django.utils.encoding import smart_text
 from rest_framework import exceptions
@@ -5,6 +10,9 @@ from rest_framework.authentication import BaseAuthentication, get_authorization_
 from rest_framework_jwt.settings import api_settings
 from rest_framework_jwt.utils import jwt_decode_handler
 
+from zc_common.cache import LRUCache
+from zc_common.settings import zc_settings
+
 
 class User(object):
     """
@@ -33,6 +41,70 @@ class User(object):
         return self.roles
 
 
+class JWTVerificationCache(object):
+    """
+    Keeps the payloads of verified tokens, keyed on the raw tokens, so that a token used for many requests is
+    only verified and decoded once. A payload is kept until the `exp` of its token, or until it is evicted
+    when it has no `exp`, and is never kept when its `exp` is not a timestamp. Payloads are copied in and out
+    of the cache, so that values such as the `roles` list are not shared between requests.
+
+    `hits` and `misses` count the tokens found in the cache and the ones that had to be verified.
+    """
+
+    def __init__(self, max_entries):
+        self._cache = LRUCache(max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        payload = self._cache.get(token)
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return copy.deepcopy(payload)
+
+    def set(self, token, payload):
+        exp = payload.get('exp')
+        if exp is None:
+            timeout = None
+        elif isinstance(exp, numbers.Real) and not isinstance(exp, bool):
+            timeout = exp - time.time()
+            if timeout <= 0:
+                return
+        else:
+            return
+        self._cache.set(token, copy.deepcopy(payload), timeout)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+
+_jwt_verification_cache = None
+
+
+def get_jwt_verification_cache():
+    """
+    Returns the shared `JWTVerificationCache` holding up to `JWT_VERIFICATION_CACHE_SIZE` tokens, or None when
+    verified tokens are not cached.
+    """
+    global _jwt_verification_cache
+
+    max_entries = zc_settings.JWT_VERIFICATION_CACHE_SIZE
+    if not max_entries:
+        return None
+
+    if _jwt_verification_cache is None:
+        _jwt_verification_cache = JWTVerificationCache(max_entries)
+    return _jwt_verification_cache
+
+
 class JWTAuthentication(BaseAuthentication):
     """
     Clients should authenticate by passing the token key in the "Authorization"
@@ -40,6 +112,9 @@ class JWTAuthentication(BaseAuthentication):
     `JWT_AUTH_HEADER_PREFIX`. For example:
 
         Authorization: JWT eyJhbGciOiAiSFMyNTYiLCAidHlwIj
+
+    With the `JWT_VERIFICATION_CACHE_SIZE` setting, the payloads of verified tokens are cached until they
+    expire, see `JWTVerificationCache`.
     """
     www_authenticate_realm = 'api'
 
@@ -69,8 +144,21 @@ class JWTAuthentication(BaseAuthentication):
         if jwt_value is None:
             raise exceptions.NotAuthenticated()
 
+        cache = get_jwt_verification_cache()
+        payload = cache.get(jwt_value) if cache is not None else None
+        if payload is None:
+            payload = self.decode(jwt_value)
+            if cache is not None:
+                cache.set(jwt_value, payload)
+
+        user = User(**payload)
+
+        return user, jwt_value
+
+    @staticmethod
+    def decode(jwt_value):
         try:
-            payload = jwt_decode_handler(jwt_value)
+            return jwt_decode_handler(jwt_value)
         except jwt.ExpiredSignature:  # pragma: no cover
             msg = 'Signature has expired.'
             raise exceptions.AuthenticationFailed(msg)
@@ -82,10 +170,6 @@ class JWTAuthentication(BaseAuthentication):
         except Exception as ex:
             raise exceptions.AuthenticationFailed(ex.message)
 
-        user = User(**payload)
-
-        return user, jwt_value
-
     def authenticate_header(self, request):
         """
         Return a string to be used as the value of the `WWW-Authenticate`
@@ -0,0 +1,192 @@
+"""
+Remote resource cache
+
+An opt-in cache of remote resource documents shared across requests, used by the renderer when including
+`RemoteResourceField`s. It is configured through the `REMOTE_RESOURCE_CACHE` setting:
+
+    REMOTE_RESOURCE_CACHE = {
+        # 'locmem' keeps documents in the memory of the process, 'django' stores them in a Django cache
+        'BACKEND': 'locmem',
+        # Name of the Django cache used by the 'django' backend
+        'ALIAS': 'default',
+        # Maximum number of documents kept by the 'locmem' backend
+        'MAX_ENTRIES': 10000,
+        # Seconds to keep the documents of each resource type. Types that are not listed are kept for `TTL`
+        # seconds, which defaults to 0 and means they are not cached at all.
+        'TTLS': {'company': 300, 'location': 300},
+        'TTL': 0,
+        # Seconds during which an expired document is still served while it is refreshed in the background
+        'STALE_TTL': 0,
+        # Number of threads refreshing stale documents in the background
+        'REFRESH_WORKERS': 2,
+    }
+
+Documents are keyed on their resource type, pk, include string and the roles of the requesting user, so a
+document fetched on behalf of some roles is never served to a request made with other roles. Only cache the
+types whose documents do not otherwise depend on the requesting user. The types are the names of the
+`RemoteResourceField`s, as passed to `event_client.get_remote_resource_data()`.
+
+Every key also carries a generation for the resource type and one for the pk. `invalidate_remote_resource()`
+replaces those generations, which makes every cached variant of the invalidated documents unreachable.
+"""
+import hashlib
+import time
+import uuid
+
+from django.core.cache import caches
+
+from zc_common.cache import LRUCache
+from zc_common.settings import zc_settings
+
+
+KEY_PREFIX = 'zc_common.remote_resource.'
+
+
+def make_key(*parts):
+    digest = hashlib.md5(u'\x1f'.join(parts).encode('utf-8')).hexdigest()
+    return KEY_PREFIX + digest
+
+
+class LocMemBackend(object):
+    """
+    The subset of Django's cache API used by `RemoteResourceCache`, backed by an in-process LRU cache.
+    """
+
+    def __init__(self, max_entries):
+        self._cache = LRUCache(max_entries)
+
+    def get_many(self, keys):
+        missing = object()
+        values = ((key, self._cache.get(key, missing)) for key in keys)
+        return {key: value for key, value in values if value is not missing}
+
+    def set_many(self, data, timeout=None):
+        for key, value in data.items():
+            self._cache.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self._cache.add(key, value, timeout)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class RemoteResourceCache(object):
+    """
+    Caches remote resource documents, each stored as a dict with the resource object under 'data' and the
+    documents it includes under 'included', the same shape as the body of a remote response. Cached
+    documents are shared between requests and must be treated as read only.
+    """
+
+    def __init__(self, backend, ttls=None, default_ttl=0, stale_ttl=0):
+        self.backend = backend
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+
+    def get_ttl(self, resource_type):
+        return self.ttls.get(resource_type, self.default_ttl)
+
+    def is_cached(self, resource_type):
+        return bool(self.get_ttl(resource_type))
+
+    def get_many(self, resource_type, pks, include, roles):
+        """
+        Returns a dict mapping the pks found in the cache to a two-tuple of their document and whether it is
+        still fresh. Documents that are not fresh have outlived their TTL but are within `stale_ttl`.
+        """
+        keys = self._get_document_keys(resource_type, pks, include, roles)
+        entries = self.backend.get_many(list(keys.values()))
+
+        now = time.time()
+        documents = {}
+        for pk, key in keys.items():
+            if key in entries:
+                fresh_until, document = entries[key]
+                documents[pk] = (document, now < fresh_until)
+        return documents
+
+    def set_many(self, resource_type, documents, include, roles):
+        """
+        Caches the documents of a dict mapping pks to documents.
+        """
+        ttl = self.get_ttl(resource_type)
+        fresh_until = time.time() + ttl
+
+        keys = self._get_document_keys(resource_type, list(documents), include, roles)
+        self.backend.set_many({keys[pk]: (fresh_until, document) for pk, document in documents.items()},
+                              ttl + self.stale_ttl)
+
+    def invalidate(self, resource_type, pk=None):
+        """
+        Drops the cached documents of a single resource, or of every resource of the type when no pk is given.
+        """
+        if pk is None:
+            self.backend.delete(make_key('generation', resource_type))
+        else:
+            self.backend.delete(make_key('generation', resource_type, str(pk)))
+
+    def _get_document_keys(self, resource_type, pks, include, roles):
+        type_generation_key = make_key('generation', resource_type)
+        generation_keys = {pk: make_key('generation', resource_type, pk) for pk in pks}
+        generations = self._get_generations([type_generation_key] + list(generation_keys.values()))
+
+        roles = u','.join(sorted(roles))
+        return {
+            pk: make_key(resource_type, generations[type_generation_key], pk, generations[generation_key],
+                         include, roles)
+            for pk, generation_key in generation_keys.items()
+        }
+
+    def _get_generations(self, keys):
+        generations = self.backend.get_many(keys)
+        missing = [key for key in keys if key not in generations]
+        if missing:
+            # A missing generation gets a new random value, so that documents cached under a generation that
+            # was invalidated, or evicted from the cache, can never be reached again.
+            for key in missing:
+                self.backend.add(key, uuid.uuid4().hex, None)
+            generations.update(self.backend.get_many(missing))
+
+            # Backends that do not keep the generation, like Django's dummy cache, never get a cache hit
+            for key in missing:
+                generations.setdefault(key, uuid.uuid4().hex)
+        return generations
+
+
+_remote_resource_cache = None
+
+
+def get_remote_resource_cache():
+    """
+    Returns the shared `RemoteResourceCache` configured by the `REMOTE_RESOURCE_CACHE` setting, or None when
+    remote resources are not cached.
+    """
+    global _remote_resource_cache
+
+    config = zc_settings.REMOTE_RESOURCE_CACHE
+    if not config:
+        return None
+
+    if _remote_resource_cache is None:
+        if config.get('BACKEND', 'locmem') == 'django':
+            backend = caches[config.get('ALIAS', 'default')]
+        else:
+            backend = LocMemBackend(config.get('MAX_ENTRIES', 10000))
+        _remote_resource_cache = RemoteResourceCache(
+            backend, config.get('TTLS'), config.get('TTL', 0), config.get('STALE_TTL', 0))
+
+    return _remote_resource_cache
+
+
+def invalidate_remote_resource(resource_type, pk=None):
+    """
+    Drops cached documents of a remote resource, for instance when an event reports that it was updated.
+    Without a pk, every cached document of the resource type is dropped.
+    """
+    cache = get_remote_resource_cache()
+    if cache is not None:
+        cache.invalidate(resource_type, pk)
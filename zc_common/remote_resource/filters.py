@@ -3,11 +3,14 @@ from distutils.util import strtobool
 
 from django.contrib.postgres.forms import SimpleArrayField
 from django.contrib.postgres.fields import ArrayField
+from django.db import connections
 from django.db.models import BooleanField, FieldDoesNotExist, ForeignKey
 from django.db.models.fields.related import ManyToManyField
 from django import forms
 from django.utils import six
 
+from zc_common.settings import zc_settings
+
 # DjangoFilterBackend was moved to django-filter and deprecated/moved from DRF in version 3.6
 try:
     from rest_framework.filters import DjangoFilterBackend, Filter
@@ -70,21 +73,64 @@ class JSONAPIFilterSet(filterset.FilterSet):
         }
 
 
-class JSONAPIFilterBackend(DjangoFilterBackend):
-    default_filter_set = JSONAPIFilterSet
+FILTER_PARAM_RE = re.compile(r'^filter\[(\w+)\]$')
 
-    # This method takes the filter query string (looks something like ?filter[xxx]=yyy) and parses into parameters
-    # that django_filters can interface with.
-    #
-    # Handles:
-    #   ?filter[id]=1
-    #   ?filter[id__in]=1,2,3
-    #   ?filter[price__gte]=100
-    #   ?filter[relatedobject__relatedobject]=1
-    #   ?filter[relatedobject__relatedobject__in]=1,2,3
-    #   ?filter[delivery_days__contains]=true  # filtering on ArrayField
-    #   ?filter[active]=1  # filtering on Boolean values of 1, 0, true or false
-    def _parse_filter_string(self, queryset, filter_class, filter_string, filter_value):
+# The internal types of the fields whose values can be bound as a single PostgreSQL array parameter
+ARRAY_FILTER_FIELD_TYPES = (
+    'AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'PositiveIntegerField',
+    'PositiveSmallIntegerField', 'SmallIntegerField', 'CharField', 'TextField',
+)
+
+
+def split_value(filter_value):
+    return filter_value.split(',')
+
+
+def boolean_value(filter_value):
+    # Allow 'true' or 'false' as values for boolean fields
+    return bool(strtobool(filter_value))
+
+
+class FilterPlan(object):
+    """
+    What `JSONAPIFilterBackend` needs to filter the queryset of a view: its filter class, the fields it may be
+    filtered on, and how each filter string translates into a field name and a value. It is built once per view
+    class and model, and the translation of each filter string is computed the first time it is used.
+
+    Only the filter strings on the fields the view may be filtered on are remembered, up to `max_filter_strings`
+    of them, since clients may send any filter string.
+    """
+    max_filter_strings = 1000
+
+    def __init__(self, filter_class, filter_fields, model):
+        self.filter_class = filter_class
+        self.filter_fields = set(filter_fields or ())
+        self.model = model
+        self.filters = filter_class.get_filters() if filter_class else {}
+        self._parsers = {}
+        self._array_fields = {}
+
+    def parse(self, filter_string, filter_value):
+        """
+        Returns the field name of a filter string, and its value converted for django_filters.
+        """
+        try:
+            field_name, converters = self._parsers[filter_string]
+        except KeyError:
+            field_name, converters = self._get_parser(filter_string)
+            self._remember(self._parsers, filter_string, field_name, (field_name, converters))
+
+        for converter in converters:
+            filter_value = converter(filter_value)
+        return field_name, filter_value
+
+    def _remember(self, cache, filter_string, field_name, value):
+        if field_name in self.filter_fields:
+            if len(cache) >= self.max_filter_strings:
+                cache.clear()
+            cache[filter_string] = value
+
+    def _get_parser(self, filter_string):
         filter_string_parts = filter_string.split('__')
         if len(filter_string_parts) > 1:
             field_name = '__'.join(filter_string_parts[:-1])
@@ -93,56 +139,140 @@ class JSONAPIFilterBackend(DjangoFilterBackend):
 
         # Translates the 'id' in ?filter[id]= into the primary key identifier, e.g. 'pk'
         if field_name == 'id':
-            primary_key = queryset.model._meta.pk.name
-            field_name = primary_key
+            field_name = self.model._meta.pk.name
 
+        converters = []
         try:
-            is_many_to_many_field = isinstance(getattr(queryset.model, filter_string).field, ManyToManyField)
-            if is_many_to_many_field:
-                filter_value = filter_value.split(',')
+            is_many_to_many_field = isinstance(getattr(self.model, filter_string).field, ManyToManyField)
         except AttributeError:
-            pass
+            is_many_to_many_field = False
+        if is_many_to_many_field or isinstance(self.filters.get(field_name), ArrayFilter):
+            converters.append(split_value)
 
         try:
-            field_filter = filter_class.get_filters().get(field_name, None)
-            is_array_filter = isinstance(field_filter, ArrayFilter)
-            if is_array_filter:
-                filter_value = filter_value.split(',')
-        except AttributeError:
+            if isinstance(self.model._meta.get_field(field_name), BooleanField):
+                converters.append(boolean_value)
+        except FieldDoesNotExist:
             pass
 
-        # Allow 'true' or 'false' as values for boolean fields
+        return field_name, tuple(converters)
+
+    def get_array_field(self, filter_string):
+        """
+        Returns the model field of an `__in` filter string whose values can be bound as a single array parameter,
+        that is a column of the model's own table holding integers or text, or None. Filter strings the filter class
+        declares a filter or a method for are left to it.
+        """
         try:
-            if isinstance(queryset.model._meta.get_field(field_name), BooleanField):
-                filter_value = bool(strtobool(filter_value))
-        except FieldDoesNotExist:
+            return self._array_fields[filter_string]
+        except KeyError:
             pass
 
-        filterset_data = {
-            'field_name': field_name,
-            'field_name_with_lookup': filter_string,
-            'filter_value': filter_value
-        }
+        field = None
+        field_name, _ = self._parsers.get(filter_string) or self._get_parser(filter_string)
+        if filter_string.endswith('__in') and '__' not in field_name and not self._is_custom_filter(filter_string):
+            try:
+                field = self.model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                pass
+
+        if field is not None:
+            target_field = field.target_field if isinstance(field, ForeignKey) else field
+            if not field.concrete or field.many_to_many or \
+                    target_field.get_internal_type() not in ARRAY_FILTER_FIELD_TYPES:
+                field = None
+
+        self._remember(self._array_fields, filter_string, field_name, field)
+        return field
+
+    def _is_custom_filter(self, filter_string):
+        if filter_string in getattr(self.filter_class, 'declared_filters', {}):
+            return True
+
+        # The filters generated from the filter fields have no method (django_filters >= 1.0) nor action
+        filter_ = self.filters.get(filter_string)
+        return getattr(filter_, 'method', None) is not None or getattr(filter_, 'action', None) is not None
+
+
+_filter_plans = {}
+
+
+def clear_filter_plans():
+    """
+    Drops the cached filter plans, for instance in tests changing the filters of a view.
+    """
+    _filter_plans.clear()
+
+
+class JSONAPIFilterBackend(DjangoFilterBackend):
+    default_filter_set = JSONAPIFilterSet
 
-        return filterset_data
+    # The filter query string (looks something like ?filter[xxx]=yyy) is parsed into parameters
+    # that django_filters can interface with, see `FilterPlan`.
+    #
+    # Handles:
+    #   ?filter[id]=1
+    #   ?filter[id__in]=1,2,3
+    #   ?filter[price__gte]=100
+    #   ?filter[relatedobject__relatedobject]=1
+    #   ?filter[relatedobject__relatedobject__in]=1,2,3
+    #   ?filter[delivery_days__contains]=true  # filtering on ArrayField
+    #   ?filter[active]=1  # filtering on Boolean values of 1, 0, true or false
+    def get_filter_plan(self, view, queryset):
+        key = (view.__class__, queryset.model)
+        plan = _filter_plans.get(key)
+        if plan is None:
+            filter_class = self.get_filter_class(view, queryset)
+            plan = _filter_plans[key] = FilterPlan(filter_class, getattr(view, 'filter_fields', None), queryset.model)
+        return plan
+
+    def filter_in_array(self, queryset, field, values):
+        """
+        Filters the queryset on a field having one of `values`, bound as a single PostgreSQL array parameter
+        (`= ANY(%s)`) rather than as one parameter per value (`IN (%s, %s, ...)`), which for thousands of values
+        is much cheaper to build, send and plan.
+        """
+        connection = connections[queryset.db]
+        try:
+            values = [field.get_db_prep_value(value, connection) for value in values]
+        except (TypeError, ValueError):
+            # Like django_filters with an invalid value
+            return queryset.none()
+
+        quote_name = connection.ops.quote_name
+        where = '{}.{} = ANY(%s)'.format(quote_name(queryset.model._meta.db_table), quote_name(field.column))
+        return queryset.extra(where=[where], params=[values])
 
     def filter_queryset(self, request, queryset, view):
-        filter_class = self.get_filter_class(view, queryset)
+        plan = self.get_filter_plan(view, queryset)
+        array_threshold = zc_settings.FILTER_IN_ARRAY_THRESHOLD
+        is_postgresql = array_threshold and connections[queryset.db].vendor == 'postgresql'
 
-        filters = []
+        filterset_data = {}
+        array_filters = []
         for param, value in six.iteritems(request.query_params):
-            match = re.search(r'^filter\[(\w+)\]$', param)
+            if not param.startswith('filter['):
+                continue
+            match = FILTER_PARAM_RE.match(param)
             if match:
                 filter_string = match.group(1)
-                parsed_filter_string = self._parse_filter_string(queryset, filter_class, filter_string, value)
-                filters.append(parsed_filter_string)
+                field_name, filter_value = plan.parse(filter_string, value)
+                if field_name not in plan.filter_fields:
+                    return queryset.none()
+
+                if is_postgresql and isinstance(filter_value, six.string_types) and \
+                        filter_value.count(',') + 1 >= array_threshold:
+                    array_field = plan.get_array_field(filter_string)
+                    if array_field is not None:
+                        array_filters.append((array_field, filter_value.split(',')))
+                        continue
+
+                filterset_data[filter_string] = filter_value
 
-                for filter_ in filters:
-                    if filter_['field_name'] not in view.filter_fields.keys():
-                        return queryset.none()
+        for array_field, values in array_filters:
+            queryset = self.filter_in_array(queryset, array_field, values)
 
-        filterset_data = {filter_['field_name_with_lookup']: filter_['filter_value'] for filter_ in filters}
-        if filter_class:
-            return filter_class(filterset_data, queryset=queryset).qs
+        if plan.filter_class:
+            return plan.filter_class(filterset_data, queryset=queryset).qs
 
         return queryset
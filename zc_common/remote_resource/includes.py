@@ -0,0 +1,435 @@
+"""
+Remote includes
+
+The renderer walks every resource in a response first and registers the remote documents needed by
+`RemoteResourceField` includes with a `RemoteIncludeCollector`. Once the walk is done, the collector fetches
+them all, concurrently when `REMOTE_INCLUDE_MAX_WORKERS` allows it, so that rendering an include-heavy list
+costs roughly the slowest remote call rather than the sum of all of them.
+
+Each distinct remote document, keyed on its type, pk, include and the roles of the requesting user, is only
+fetched once per collector no matter how many resources point to it. When `REMOTE_RESOURCE_CACHE` is set,
+documents are also looked up in and stored to the cache shared across requests (see `remote_resource.cache`).
+Cached documents that expired less than `STALE_TTL` seconds ago are served as they are and refreshed in the
+background, so that a slow remote service does not hold up responses it served moments ago.
+
+`REMOTE_INCLUDE_CIRCUIT_BREAKER` sets up a circuit breaker per resource type. Once a type failed too many
+times in a row, requests for it fail fast until a cool down passes, instead of piling up worker threads
+waiting on a service that is down.
+
+With `REMOTE_INCLUDE_BATCH_SIZE` set, documents of the same type are requested together through a single
+`filter[id__in]=` request per batch of ids instead of one request per document.
+"""
+from collections import OrderedDict
+import logging
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+import ujson
+from zc_events.exceptions import RequestTimeout
+
+from zc_common.remote_resource.cache import get_remote_resource_cache
+from zc_common.settings import zc_settings
+
+
+logger = logging.getLogger('django')
+
+
+class RemoteResourceIncludeError(Exception):
+
+    def __init__(self, field, data=None):
+        self.field = field
+        self.message = "There was an error including the field {}".format(field)
+
+        data['meta'] = {'include_field': field}
+        self.data = [data]
+
+    def __str__(self):
+        return self.message
+
+
+class RemoteResourceIncludeTimeoutError(RemoteResourceIncludeError):
+
+    def __init__(self, field):
+        self.field = field
+        self.message = "Timeout error requesting remote resource {}".format(field)
+
+        self.data = [{
+            "status": "503",
+            "source": {
+                "pointer": "/data"
+            },
+            "meta": {
+                "include_field": field,
+            },
+            "detail": self.message
+        }]
+
+
+class RemoteResourceUnavailableError(RemoteResourceIncludeTimeoutError):
+
+    def __init__(self, field):
+        super(RemoteResourceUnavailableError, self).__init__(field)
+        self.message = "Remote resource {} is unavailable".format(field)
+        self.data[0]['detail'] = self.message
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a remote resource type after `failure_threshold` consecutive failures. Calls then fail fast
+    for `cool_down` seconds, after which a single trial call is let through: the breaker closes again when the
+    trial succeeds, and stays open for another cool down when it fails.
+    """
+
+    def __init__(self, failure_threshold, cool_down):
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+
+            if self._trial_in_progress or time.time() < self.opened_at + self.cool_down:
+                return False
+
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(resource_type):
+    """
+    Returns the circuit breaker of a remote resource type, or None when `REMOTE_INCLUDE_CIRCUIT_BREAKER` is
+    not set.
+    """
+    config = zc_settings.REMOTE_INCLUDE_CIRCUIT_BREAKER
+    if not config:
+        return None
+
+    with _circuit_breakers_lock:
+        if resource_type not in _circuit_breakers:
+            _circuit_breakers[resource_type] = CircuitBreaker(
+                config.get('FAILURE_THRESHOLD', 5), config.get('COOL_DOWN', 30))
+        return _circuit_breakers[resource_type]
+
+
+def fetch_remote_document(event_client, field_name, pk, include, user_id, roles):
+    """
+    Fetches a remote document through the event client and returns the decoded body of the response. A tuple
+    of ids in place of a single pk fetches them all through a `filter[id__in]=` list request, which fails like
+    a detail request would when one of the ids is not found.
+
+    Timeouts and server errors count as failures of the resource type's circuit breaker, and requests fail
+    fast with a `RemoteResourceUnavailableError` while it is open.
+    """
+    breaker = get_circuit_breaker(field_name)
+    if breaker is not None and not breaker.allow_request():
+        raise RemoteResourceUnavailableError(field_name)
+
+    try:
+        if isinstance(pk, tuple):
+            remote_resource = event_client.get_remote_resource_data(
+                field_name, user_id=user_id, include=include, page_size=len(pk), roles=roles,
+                query_params={'filter[id__in]': ','.join(pk)})
+        else:
+            remote_resource = event_client.get_remote_resource_data(
+                field_name, pk=pk, user_id=user_id,
+                include=include, page_size=1000, roles=roles)
+    except RequestTimeout:
+        if breaker is not None:
+            breaker.record_failure()
+        raise RemoteResourceIncludeTimeoutError(field_name)
+    except Exception:
+        if breaker is not None:
+            breaker.record_failure()
+        raise
+
+    if breaker is not None:
+        if remote_resource['status'] >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    body = ujson.loads(remote_resource['body'])
+
+    if 400 <= remote_resource['status'] < 600:
+        raise RemoteResourceIncludeError(field_name, body["errors"][0])
+
+    if isinstance(pk, tuple):
+        found = set(str(resource['id']) for resource in body['data'])
+        missing = [id_ for id_ in pk if str(id_) not in found]
+        if missing:
+            raise RemoteResourceIncludeError(field_name, {
+                'status': '404',
+                'detail': 'Not found: {} {}'.format(field_name, ','.join(missing)),
+            })
+
+    return body
+
+
+_refresh_pool = None
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+def refresh_in_background(cache, event_client, field_name, pk, include, user_id, roles):
+    """
+    Fetches a stale document again in a background thread and stores it in the cache. Refreshes of a document
+    that is already being refreshed are skipped.
+    """
+    global _refresh_pool
+
+    key = (field_name, pk, include, tuple(sorted(roles)))
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+        if _refresh_pool is None:
+            _refresh_pool = ThreadPool((zc_settings.REMOTE_RESOURCE_CACHE or {}).get('REFRESH_WORKERS', 2))
+
+    _refresh_pool.apply_async(_refresh, (key, cache, event_client, field_name, pk, include, user_id, roles))
+
+
+def _refresh(key, cache, event_client, field_name, pk, include, user_id, roles):
+    try:
+        body = fetch_remote_document(event_client, field_name, pk, include, user_id, roles)
+        cache.set_many(field_name, {pk: {'data': body['data'], 'included': body.get('included') or []}},
+                       include, roles)
+    except Exception:
+        logger.warning("Failed to refresh remote resource %s %s", field_name, pk, exc_info=True)
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(key)
+
+
+def split_compound_document(body):
+    """
+    Splits the body of a list response into one document per resource object, keyed on its id. Each document
+    only keeps the included documents that its resource object links to, directly or through other included
+    documents.
+    """
+    included_by_key = {(item['type'], item['id']): item for item in body.get('included') or []}
+
+    documents = {}
+    for resource in body['data']:
+        linked = []
+        seen = set()
+        stack = [resource]
+        while stack:
+            for relationship in (stack.pop().get('relationships') or {}).values():
+                linkage = relationship.get('data') or []
+                if isinstance(linkage, dict):
+                    linkage = [linkage]
+
+                for identifier in linkage:
+                    key = (identifier['type'], identifier['id'])
+                    if key in included_by_key and key not in seen:
+                        seen.add(key)
+                        linked.append(included_by_key[key])
+                        stack.append(included_by_key[key])
+
+        documents[resource['id']] = {'data': resource, 'included': linked}
+
+    return documents
+
+
+class RemoteIncludeCollector(object):
+    """
+    Collects the remote documents to include in a single response and fetches them in one go.
+
+    `max_workers` bounds the number of remote calls in flight at once; with a value of 1 the documents are
+    fetched serially in the calling thread. `timeout` is a deadline in seconds for the whole fetch, after which
+    a `RemoteResourceIncludeTimeoutError` is raised for the first include that has not completed.
+    `batch_size` is the maximum number of ids sent in one bulk request, or None to request every document
+    on its own. `cache` is the `RemoteResourceCache` shared across requests, which defaults to the one
+    configured by the `REMOTE_RESOURCE_CACHE` setting.
+
+    `hits` and `misses` count the includes that were already known to the collector and the ones that had to
+    be fetched, respectively.
+    """
+
+    def __init__(self, request, event_client, max_workers=None, timeout=None, batch_size=None, cache=None):
+        self.request = request
+        self.event_client = event_client
+        self.max_workers = max_workers if max_workers is not None else zc_settings.REMOTE_INCLUDE_MAX_WORKERS
+        self.timeout = timeout if timeout is not None else zc_settings.REMOTE_INCLUDE_TIMEOUT
+        self.batch_size = batch_size if batch_size is not None else zc_settings.REMOTE_INCLUDE_BATCH_SIZE
+        self.cache = cache if cache is not None else get_remote_resource_cache()
+        self.pending = []
+        self.hits = 0
+        self.misses = 0
+        self._keys = set()
+        self._cancelled = False
+
+    @property
+    def user_id(self):
+        return getattr(self.request.user, 'id', None)
+
+    @property
+    def roles(self):
+        return self.request.user.roles
+
+    def add(self, field_name, pk, include):
+        key = (field_name, pk, include, tuple(sorted(self.roles)))
+        if key in self._keys:
+            self.hits += 1
+            return
+
+        self.misses += 1
+        self._keys.add(key)
+        self.pending.append((field_name, pk, include))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def fetch(self):
+        """
+        Fetches every pending remote document and returns them, along with their own included documents,
+        as a flat list of resource objects.
+        """
+        pending, self.pending = self.pending, []
+        if not pending:
+            return []
+
+        bodies = []
+        if self.cache is not None:
+            bodies, pending = self._get_cached(pending)
+
+        remote_requests = self._batch(pending) if self.batch_size else pending
+
+        deadline = time.time() + self.timeout if self.timeout else None
+        if self.max_workers > 1 and len(remote_requests) > 1:
+            fetched_bodies = self._fetch_concurrently(remote_requests, deadline)
+        else:
+            fetched_bodies = self._fetch_serially(remote_requests, deadline)
+
+        if self.cache is not None:
+            for remote_request, body in zip(remote_requests, fetched_bodies):
+                self._set_cached(remote_request, body)
+        bodies.extend(fetched_bodies)
+
+        included_data = []
+        for body in bodies:
+            if isinstance(body['data'], list):
+                included_data.extend(body['data'])
+            else:
+                included_data.append(body['data'])
+
+            if body.get('included'):
+                included_data.extend(body['included'])
+
+        return included_data
+
+    def _get_cached(self, pending):
+        """
+        Looks the pending documents up in the shared cache. Returns the documents that were found and the
+        pending documents that still have to be fetched.
+        """
+        grouped = OrderedDict()
+        for field_name, pk, include in pending:
+            if self.cache.is_cached(field_name):
+                grouped.setdefault((field_name, include), []).append(pk)
+
+        cached = {}
+        for (field_name, include), pks in grouped.items():
+            for pk, (document, fresh) in self.cache.get_many(field_name, pks, include, self.roles).items():
+                cached[(field_name, pk, include)] = document
+                if not fresh:
+                    refresh_in_background(self.cache, self.event_client, field_name, pk, include,
+                                          self.user_id, self.roles)
+
+        documents = [cached[remote_request] for remote_request in pending if remote_request in cached]
+        return documents, [remote_request for remote_request in pending if remote_request not in cached]
+
+    def _set_cached(self, remote_request, body):
+        field_name, pk, include = remote_request
+        if not self.cache.is_cached(field_name):
+            return
+
+        if isinstance(pk, tuple):
+            documents = split_compound_document(body)
+        else:
+            documents = {pk: {'data': body['data'], 'included': body.get('included') or []}}
+        self.cache.set_many(field_name, documents, include, self.roles)
+
+    def _batch(self, pending):
+        """
+        Groups the pending documents by type and include, and splits each group into requests of at most
+        `batch_size` ids. A tuple of ids in place of a single pk marks a bulk request.
+        """
+        grouped = OrderedDict()
+        for field_name, pk, include in pending:
+            grouped.setdefault((field_name, include), []).append(pk)
+
+        remote_requests = []
+        for (field_name, include), pks in grouped.items():
+            if len(pks) == 1:
+                remote_requests.append((field_name, pks[0], include))
+                continue
+
+            for start in range(0, len(pks), self.batch_size):
+                remote_requests.append((field_name, tuple(pks[start:start + self.batch_size]), include))
+
+        return remote_requests
+
+    def _fetch_serially(self, remote_requests, deadline):
+        bodies = []
+        for field_name, pk, include in remote_requests:
+            if deadline is not None and time.time() > deadline:
+                raise RemoteResourceIncludeTimeoutError(field_name)
+            bodies.append(self._fetch_one(field_name, pk, include))
+        return bodies
+
+    def _fetch_concurrently(self, remote_requests, deadline):
+        pool = ThreadPool(min(self.max_workers, len(remote_requests)))
+        try:
+            results = [pool.apply_async(self._fetch_one, request) for request in remote_requests]
+
+            bodies = []
+            for (field_name, pk, include), result in zip(remote_requests, results):
+                timeout = max(deadline - time.time(), 0) if deadline is not None else None
+                try:
+                    bodies.append(result.get(timeout))
+                except TimeoutError:
+                    raise RemoteResourceIncludeTimeoutError(field_name)
+            return bodies
+        except Exception:
+            # Calls that have not started yet are skipped once the response is known to fail
+            self._cancelled = True
+            raise
+        finally:
+            # Never join the workers here: a call stuck past the deadline must not hold up the response
+            pool.close()
+
+    def _fetch_one(self, field_name, pk, include):
+        if self._cancelled:
+            return None
+
+        return fetch_remote_document(self.event_client, field_name, pk, include, self.user_id, self.roles)
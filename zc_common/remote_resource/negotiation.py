@@ -12,8 +12,27 @@ from rest_framework.utils.mediatypes import (
 
 from rest_framework.negotiation import BaseContentNegotiation
 
+from zc_common.cache import LRUCache
+
+
+# Clients send a handful of distinct Accept and Content-Type headers, so the decisions taken for each header and
+# set of renderer or parser classes are kept, up to this many of each.
+NEGOTIATION_CACHE_SIZE = 512
+
+_renderer_selections = LRUCache(NEGOTIATION_CACHE_SIZE)
+_parser_selections = LRUCache(NEGOTIATION_CACHE_SIZE)
+
+
+def clear_negotiation_caches():
+    _renderer_selections.clear()
+    _parser_selections.clear()
+
 
 class JsonAPIContentNegotiation(BaseContentNegotiation):
+    """
+    Selects renderers and parsers like DRF, remembering the index of the renderer or parser selected for each
+    header and list of renderer or parser classes, so that the media types are only parsed and compared once.
+    """
     settings = api_settings
 
     def select_parser(self, request, parsers):
@@ -21,9 +40,17 @@ class JsonAPIContentNegotiation(BaseContentNegotiation):
         Given a list of parsers and a media type, return the appropriate
         parser to handle the incoming request.
         """
-        for parser in parsers:
-            if media_type_matches(parser.media_type, request.content_type):
-                return parser
+        key = (request.content_type, tuple(parser.__class__ for parser in parsers))
+        index = _parser_selections.get(key, -1)
+        if index == -1:
+            index = self._select_parser(request.content_type, parsers)
+            _parser_selections.set(key, index)
+        return parsers[index] if index is not None else None
+
+    def _select_parser(self, content_type, parsers):
+        for index, parser in enumerate(parsers):
+            if media_type_matches(parser.media_type, content_type):
+                return index
         return None
 
     def select_renderer(self, request, renderers, format_suffix=None):
@@ -31,6 +58,23 @@ class JsonAPIContentNegotiation(BaseContentNegotiation):
         Given a request and a list of renderers, return a two-tuple of:
         (renderer, media type).
         """
+        header = request.META.get('HTTP_ACCEPT', '*/*')
+        key = (header, tuple(renderer.__class__ for renderer in renderers), format_suffix)
+        selection = _renderer_selections.get(key)
+        if selection is None:
+            selection = self._select_renderer(request, renderers)
+            _renderer_selections.set(key, selection)
+
+        index, media_type = selection
+        if index is None:
+            raise exceptions.NotAcceptable(available_renderers=renderers)
+        return renderers[index], media_type
+
+    def _select_renderer(self, request, renderers):
+        """
+        Returns a two-tuple of the index of the renderer to use and the accepted media type, or of None and None
+        when no renderer is acceptable.
+        """
         accepts = self.get_accept_list(request)
 
         # Check the acceptable media types against each renderer,
@@ -38,7 +82,7 @@ class JsonAPIContentNegotiation(BaseContentNegotiation):
         # NB. The inner loop here isn't as bad as it first looks :)
         #     Worst case is we're looping over len(accept_list) * len(self.renderers)
         for media_type_set in order_by_precedence(accepts):
-            for renderer in renderers:
+            for index, renderer in enumerate(renderers):
                 for media_type in media_type_set:
                     if media_type_matches(renderer.media_type, media_type):
                         # Return the most specific media type as accepted.
@@ -54,13 +98,13 @@ class JsonAPIContentNegotiation(BaseContentNegotiation):
                                 tuple('{0}={1}'.format(
                                     key, value.decode(HTTP_HEADER_ENCODING))
                                     for key, value in media_type_wrapper.params.items()))
-                            return renderer, full_media_type
+                            return index, full_media_type
                         else:
                             # Eg client requests 'application/json; indent=8'
                             # Accepted media type is 'application/json; indent=8'
-                            return renderer, media_type
+                            return index, media_type
 
-        raise exceptions.NotAcceptable(available_renderers=renderers)
+        return None, None
 
     def filter_renderers(self, renderers, format):
         """
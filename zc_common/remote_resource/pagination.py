@@ -7,12 +7,68 @@ Had to create this custom pagination to include self link
 see:
 https://github.com/django-json-api/django-rest-framework-json-api/blob/develop/rest_framework_json_api/pagination.py
 """
+from base64 import b64encode
 from collections import OrderedDict
+import hashlib
+import json
 
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, InvalidPage, Page, PageNotAnInteger, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils import six
+from django.utils.functional import cached_property
 from django.utils.six.moves.urllib import parse as urlparse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination as OldCursorPagination
 from rest_framework.pagination import PageNumberPagination as OldPagination
+from rest_framework.pagination import _positive_int
 from rest_framework.views import Response
 
+from zc_common.settings import zc_settings
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'none'
+
+
+class ParsedURL(object):
+    """
+    A URL whose query string is parsed and encoded once, from which URLs with a query
+    parameter replaced or removed are then built without parsing the query string again.
+    This matters for links carrying long `filter[id__in]=` lists.
+
+    Blank query parameters are kept, so that the `?filter[id__in]=` blank query parameter
+    of our links is not removed in the case of an empty remote to-many link.
+    """
+
+    def __init__(self, url):
+        (self.scheme, self.netloc, self.path, query, self.fragment) = urlparse.urlsplit(url)
+        query_dict = urlparse.parse_qs(query, keep_blank_values=True)
+
+        # The encoded query string of each parameter, in the order of their keys
+        self.encoded_params = OrderedDict(
+            (key, urlparse.urlencode([(key, values)], doseq=True)) for key, values in sorted(query_dict.items()))
+
+    def replace_query_param(self, key, val):
+        encoded_params = self.encoded_params.copy()
+        encoded_params[key] = urlparse.urlencode([(key, [val])], doseq=True)
+        return self._build_url(sorted(encoded_params.items()))
+
+    def remove_query_param(self, key):
+        return self._build_url((param, encoded) for param, encoded in self.encoded_params.items() if param != key)
+
+    def _build_url(self, encoded_params):
+        query = '&'.join(encoded for _, encoded in encoded_params)
+        return urlparse.urlunsplit((self.scheme, self.netloc, self.path, query, self.fragment))
+
 
 def remove_query_param(url, key):
     """
@@ -24,11 +80,7 @@ def remove_query_param(url, key):
     it doesn't remove the ?ifilter[id__in]= blank query parameter from
     our links in the case of an empty remote to-many link.
     """
-    (scheme, netloc, path, query, fragment) = urlparse.urlsplit(url)
-    query_dict = urlparse.parse_qs(query, keep_blank_values=True)
-    query_dict.pop(key, None)
-    query = urlparse.urlencode(sorted(list(query_dict.items())), doseq=True)
-    return urlparse.urlunsplit((scheme, netloc, path, query, fragment))
+    return ParsedURL(url).remove_query_param(key)
 
 
 def replace_query_param(url, key, val):
@@ -41,26 +93,202 @@ def replace_query_param(url, key, val):
     it doesn't remove the ?filter[id__in]= blank query parameter from
     our links in the case of an empty remote to-many link.
     """
-    (scheme, netloc, path, query, fragment) = urlparse.urlsplit(url)
-    query_dict = urlparse.parse_qs(query, keep_blank_values=True)
-    query_dict[key] = [val]
-    query = urlparse.urlencode(sorted(list(query_dict.items())), doseq=True)
-    return urlparse.urlunsplit((scheme, netloc, path, query, fragment))
+    return ParsedURL(url).replace_query_param(key, val)
+
+
+def get_count_cache_key(queryset):
+    """
+    Returns the cache key of the count of a queryset, or None when the queryset can't match any row.
+    """
+    queryset = queryset.order_by()
+    try:
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return None
+
+    digest = hashlib.md5(repr((queryset.db, sql, params)).encode('utf-8')).hexdigest()
+    return 'zc_common.pagination.count.' + digest
+
+
+def estimate_count(queryset):
+    """
+    Returns the number of rows PostgreSQL's planner expects a queryset to return, or None on other databases.
+    The estimate is read from the table statistics, which are updated by `ANALYZE`, and is only as accurate as
+    they are.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    try:
+        sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CountlessPage(Page):
+    """
+    A page that knows whether there is a next page without knowing the number of pages.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super(CountlessPage, self).__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class Paginator(DjangoPaginator):
+    """
+    A Django paginator getting the count of the collection according to `count_mode`:
+
+    * `exact` runs a `COUNT(*)`, whose result is cached for `count_cache_timeout` seconds when it is set.
+    * `estimate` uses the estimate of the database, on PostgreSQL, and otherwise falls back to an exact count.
+      Estimates lower than `min_estimated_count` are replaced by an exact count, which is cheap for them.
+    * `none` skips the count altogether, and `count` and `num_pages` are None.
+
+    Unless the count is exact, pages are loaded along with the first item of the next page, which tells whether
+    there is one, rather than being checked against the number of pages.
+    """
+
+    min_estimated_count = 10000
+
+    def __init__(self, object_list, per_page, count_mode=COUNT_EXACT, count_cache_timeout=0, **kwargs):
+        super(Paginator, self).__init__(object_list, per_page, **kwargs)
+        self.count_mode = count_mode
+        self.count_cache_timeout = count_cache_timeout
+
+    @cached_property
+    def count(self):
+        if self.count_mode == COUNT_NONE:
+            return None
+        if not isinstance(self.object_list, QuerySet):
+            return len(self.object_list)
+
+        if self.count_mode == COUNT_ESTIMATE:
+            count = estimate_count(self.object_list)
+            if count is not None and count >= self.min_estimated_count:
+                return count
+
+        if not self.count_cache_timeout:
+            return self.object_list.count()
+
+        cache_key = get_count_cache_key(self.object_list)
+        if cache_key is None:
+            return 0
+        count = cache.get(cache_key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(cache_key, count, self.count_cache_timeout)
+        return count
+
+    @cached_property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return super(Paginator, self).num_pages
+
+    def validate_number(self, number):
+        if self.count_mode == COUNT_EXACT:
+            return super(Paginator, self).validate_number(number)
+
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        if self.count_mode == COUNT_EXACT:
+            return super(Paginator, self).page(number)
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+        return CountlessPage(object_list[:self.per_page], number, self, len(object_list) > self.per_page)
 
 
 class PageNumberPagination(OldPagination):
     """
     A json-api compatible pagination format
+
+    The count of the collection is exact by default. Set `count_mode` on a subclass, or
+    `pagination_count_mode` on a view, to `'estimate'` to use the estimate of PostgreSQL, or
+    to `'none'` to skip the count, the number of pages and the `last` link. Clients may also
+    opt out of the exact count with the `count` query parameter, e.g. `?count=none`.
     """
 
+    django_paginator_class = Paginator
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
+    count_mode = COUNT_EXACT
+    count_query_param = 'count'
+    # The count modes clients may select with `count_query_param`, which are cheaper than an exact count
+    client_count_modes = (COUNT_ESTIMATE, COUNT_NONE)
+
+    def get_count_mode(self, request, view=None):
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode in self.client_count_modes:
+            return count_mode
+        return getattr(view, 'pagination_count_mode', self.count_mode)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Copied from rest_framework's PageNumberPagination in order to create the paginator
+        with the count mode, and to skip its count unless it is needed.
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(
+            queryset, page_size, count_mode=self.get_count_mode(request, view),
+            count_cache_timeout=zc_settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        page_number = request.query_params.get(self.page_query_param, 1)
+        if page_number in self.last_page_strings:
+            page_number = paginator.num_pages
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=six.text_type(exc)
+            )
+            raise NotFound(msg)
+
+        if (self.page.has_next() or self.page.has_previous()) and self.template is not None:
+            # The browsable API should display pagination controls.
+            self.display_page_controls = True
+
+        self.request = request
+        self._url = None
+        return list(self.page)
+
+    def get_url(self):
+        """
+        Returns the `ParsedURL` of the request, which all the links are built from.
+        """
+        if getattr(self, '_url', None) is None:
+            self._url = ParsedURL(self.request and self.request.build_absolute_uri() or '')
+        return self._url
+
     def build_link(self, index):
         if not index:
             return None
-        url = self.request and self.request.build_absolute_uri() or ''
-        return replace_query_param(url, 'page', index)
+        return self.get_url().replace_query_param(self.page_query_param, index)
 
     def get_paginated_response(self, data):
         next_page = None
@@ -71,22 +299,96 @@ class PageNumberPagination(OldPagination):
         if self.page.has_previous():
             previous_page = self.page.previous_page_number()
 
+        pagination = OrderedDict([('page', self.page.number)])
+        paginator = self.page.paginator
+        if paginator.count is not None:
+            pagination['pages'] = paginator.num_pages
+            pagination['count'] = paginator.count
+
+        # The last page is only known for sure from an exact count
+        last_page = paginator.num_pages if paginator.count_mode == COUNT_EXACT else None
+
         # hamedahmadi 05/02/2016 -- Adding this to include self link
-        self_url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        self_url = self.get_url().remove_query_param(self.page_query_param)
         return Response({
             'results': data,
             'meta': {
-                'pagination': OrderedDict([
-                    ('page', self.page.number),
-                    ('pages', self.page.paginator.num_pages),
-                    ('count', self.page.paginator.count),
-                ])
+                'pagination': pagination
             },
             'links': OrderedDict([
                 ('self', self_url),
                 ('first', self.build_link(1)),
-                ('last', self.build_link(self.page.paginator.num_pages)),
+                ('last', self.build_link(last_page)),
                 ('next', self.build_link(next_page)),
                 ('prev', self.build_link(previous_page))
             ])
         })
+
+
+class CursorPagination(OldCursorPagination):
+    """
+    A json-api compatible cursor pagination format
+
+    Pages are selected with a `WHERE` on the ordering field rather than an `OFFSET`, and no
+    `COUNT(*)` is run, so a deep page costs the same as the first one. The ordering field
+    must be indexed, and should be unique and unchanging, which the primary key used by
+    default is. The links have the same shape as the ones of `PageNumberPagination`, but
+    there is no `last` link and the meta holds no page number or count.
+    """
+
+    ordering = '-pk'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+
+        return self.page_size
+
+    def encode_cursor(self, cursor):
+        """
+        Overwritten to build the link with our `replace_query_param`, which keeps blank query parameters.
+        """
+        tokens = {}
+        if cursor.offset != 0:
+            tokens['o'] = str(cursor.offset)
+        if cursor.reverse:
+            tokens['r'] = '1'
+        if cursor.position is not None:
+            tokens['p'] = cursor.position
+
+        querystring = urlparse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return self.get_base_url().replace_query_param(self.cursor_query_param, encoded)
+
+    def get_base_url(self):
+        """
+        Returns the `ParsedURL` of the request, which all the links are built from.
+        """
+        if getattr(self, '_base_url', None) is None or self._base_url[0] != self.base_url:
+            self._base_url = (self.base_url, ParsedURL(self.base_url))
+        return self._base_url[1]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'meta': {
+                'pagination': OrderedDict([
+                    ('page_size', self.page_size),
+                ])
+            },
+            'links': OrderedDict([
+                ('self', self.base_url),
+                ('first', self.get_base_url().remove_query_param(self.cursor_query_param)),
+                ('next', self.get_next_link()),
+                ('prev', self.get_previous_link())
+            ])
+        })
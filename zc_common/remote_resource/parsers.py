@@ -1,6 +1,9 @@
 """
 Parsers
 """
+import codecs
+import re
+
 import ujson
 
 from rest_framework import parsers
@@ -18,6 +21,205 @@ def key_formatter():
         return utils.format_keys
 
 
+RESOURCE_IDENTIFIER_KEYS = ('type', 'id')
+
+
+def format_resource_identifier(resource_identifier):
+    if isinstance(resource_identifier, dict) and any(key not in RESOURCE_IDENTIFIER_KEYS
+                                                     for key in resource_identifier):
+        return key_formatter()(resource_identifier, 'underscore')
+    return resource_identifier
+
+
+class PrimaryDataScanner(object):
+    """
+    Reads a JSON API document from a stream, one chunk at a time, and iterates over the items of its primary data
+    as they are read. Each item is decoded on its own, and the text of the document read before it is dropped, so
+    that the memory used is bounded by the size of the largest item instead of that of the document. A document
+    whose primary data is a single object yields that object.
+
+    The other top-level members of the document, like `meta` and `included`, are skipped.
+    """
+
+    # A whole string, a structural character, or the opening quote of a string that the buffer cuts short
+    TOKENS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]|"')
+    END_OF_SCALAR = re.compile(r'[\s,\]}]')
+    NOT_WHITESPACE = re.compile(r'\S')
+
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = u''
+        self.pos = 0
+        self.found = False
+
+    def __iter__(self):
+        if self.next_character() != u'{':
+            raise ParseError('Received document is not a JSON object')
+        self.pos += 1
+
+        while True:
+            character = self.next_character()
+            if character == u'}':
+                return
+            if character != u'"':
+                raise ParseError('JSON parse error - Expected a member name')
+
+            name = self.decode(self.read_value())
+            if self.next_character() != u':':
+                raise ParseError('JSON parse error - Expected ":"')
+            self.pos += 1
+
+            character = self.next_character()
+            if name == 'data':
+                self.found = True
+                if character == u'[':
+                    self.pos += 1
+                    for item in self.iter_array():
+                        yield item
+                else:
+                    yield self.decode(self.read_value())
+            else:
+                self.read_value(keep=False)
+
+            character = self.next_character()
+            if character == u',':
+                self.pos += 1
+            elif character != u'}':
+                raise ParseError('JSON parse error - Expected "," or "}"')
+
+    def iter_array(self):
+        if self.next_character() == u']':
+            self.pos += 1
+            return
+
+        while True:
+            self.next_character()
+            yield self.decode(self.read_value())
+
+            character = self.next_character()
+            self.pos += 1
+            if character == u']':
+                return
+            if character != u',':
+                raise ParseError('JSON parse error - Expected "," or "]"')
+
+    @staticmethod
+    def decode(text):
+        try:
+            return ujson.loads(text)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - {}'.format(exc))
+
+    def read(self):
+        """
+        Appends the next chunk of the stream to the buffer, and returns whether there was one.
+        """
+        while True:
+            chunk = self.stream.read(self.chunk_size)
+            text = chunk
+            if isinstance(chunk, bytes):
+                try:
+                    text = self.decoder.decode(chunk, final=not chunk)
+                except UnicodeDecodeError as exc:
+                    raise ParseError('JSON parse error - {}'.format(exc))
+            if not chunk:
+                return False
+            if text:
+                # A chunk may end in the middle of a multibyte character, leaving nothing to decode yet
+                self.buffer += text
+                return True
+
+    def discard(self):
+        """
+        Drops the text of the buffer before the current position, once it is at least a chunk long. Dropping it for
+        every token would copy the rest of the buffer each time.
+        """
+        if self.pos >= self.chunk_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+
+    def next_character(self):
+        """
+        Moves past whitespace and returns the next character, or None at the end of the stream.
+        """
+        self.discard()
+        while True:
+            match = self.NOT_WHITESPACE.search(self.buffer, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buffer[self.pos]
+            self.pos = len(self.buffer)
+            self.discard()
+            if not self.read():
+                return None
+
+    def read_value(self, keep=True):
+        """
+        Moves past the value at the current position, and returns its text. Unless it is kept, the text is
+        dropped as it is read.
+        """
+        start = self.pos
+        end = self.find_value_end(keep)
+        if not keep:
+            return None
+        return self.buffer[start:end]
+
+    def find_value_end(self, keep):
+        depth = 0
+        index = self.pos
+        if index == len(self.buffer):
+            raise ParseError('JSON parse error - Unexpected end of document')
+
+        if self.END_OF_SCALAR.match(self.buffer, index):
+            raise ParseError('JSON parse error - Expected a value')
+
+        if self.buffer[index] not in u'"[{':
+            while True:
+                match = self.END_OF_SCALAR.search(self.buffer, index)
+                if match:
+                    self.pos = match.start()
+                    return self.pos
+                index = self.more(index, keep)
+                if index is None:
+                    self.pos = len(self.buffer)
+                    return self.pos
+
+        while True:
+            match = self.TOKENS.search(self.buffer, index)
+            if match is None or match.group() == u'"':
+                # Read on, from the start of the string when the buffer ends in the middle of one
+                index = self.more(match.start() if match else len(self.buffer), keep)
+                if index is None:
+                    raise ParseError('JSON parse error - Unexpected end of document')
+                continue
+
+            token = match.group()
+            index = match.end()
+            if token in (u'[', u'{'):
+                depth += 1
+            elif token in (u']', u'}'):
+                depth -= 1
+
+            if depth == 0:
+                self.pos = index
+                return index
+
+    def more(self, index, keep):
+        """
+        Reads the next chunk of the stream while scanning a value at `index`, and returns the index of the same
+        character in the buffer, or None at the end of the stream.
+        """
+        if not keep:
+            self.pos = index
+            self.discard()
+            index = self.pos
+        if not self.read():
+            return None
+        return index
+
+
 class JSONParser(parsers.JSONParser):
     """
     A JSON API client will send a payload that looks like this:
@@ -40,21 +242,45 @@ class JSONParser(parsers.JSONParser):
 
     @staticmethod
     def parse_attributes(data):
-        return key_formatter()(data.get('attributes'), 'underscore') if data.get('attributes') else dict()
+        """
+        Underscores the keys of the attributes, and of the objects they hold, through the memoized `format_key()`.
+        """
+        attributes = data.get('attributes')
+        if not attributes:
+            return dict()
+        if not isinstance(attributes, dict):
+            raise ParseError('The attributes of a JSONAPI Resource Object must be an object')
+
+        return {
+            zc_common_utils.format_key(key, 'underscore'): (
+                key_formatter()(value, 'underscore') if isinstance(value, (dict, list)) else value)
+            for key, value in attributes.items()
+        }
 
     @staticmethod
     def parse_relationships(data):
-        relationships = (key_formatter()(data.get('relationships'), 'underscore')
-                         if data.get('relationships') else dict())
+        """
+        Reads the resource linkage of each relationship. Only the relationship names are underscored, and the
+        resource identifier objects are kept as they are unless they carry more than a type and an id.
+        """
+        relationships = data.get('relationships')
+        if not relationships:
+            return dict()
+        if not isinstance(relationships, dict):
+            raise ParseError('The relationships of a JSONAPI Resource Object must be an object')
 
         # Parse the relationships
         parsed_relationships = dict()
         for field_name, field_data in relationships.items():
+            if not isinstance(field_data, dict):
+                raise ParseError('The relationship {} is not a JSONAPI Relationship Object'.format(field_name))
+
+            field_name = zc_common_utils.format_key(field_name, 'underscore')
             field_data = field_data.get('data')
             if isinstance(field_data, dict) or field_data is None:
-                parsed_relationships[field_name] = field_data
+                parsed_relationships[field_name] = format_resource_identifier(field_data)
             elif isinstance(field_data, list):
-                parsed_relationships[field_name] = list(relation for relation in field_data)
+                parsed_relationships[field_name] = [format_resource_identifier(item) for item in field_data]
         return parsed_relationships
 
     @staticmethod
@@ -65,6 +291,30 @@ class JSONParser(parsers.JSONParser):
         else:
             return {}
 
+    def parse_resource_object(self, data, result, parser_context):
+        if not isinstance(data, dict):
+            raise ParseError('Received data is not a valid JSONAPI Resource Object')
+
+        request = parser_context.get('request')
+
+        # Check for inconsistencies
+        resource_name = utils.get_resource_name(parser_context)
+        if data.get('type') != resource_name and request.method in ('PUT', 'POST', 'PATCH'):
+            raise exceptions.Conflict(
+                "The resource object's type ({data_type}) is not the type "
+                "that constitute the collection represented by the endpoint ({resource_type}).".format(
+                    data_type=data.get('type'),
+                    resource_type=resource_name
+                )
+            )
+
+        # Construct the return data
+        parsed_data = {'id': data.get('id')}
+        parsed_data.update(self.parse_attributes(data))
+        parsed_data.update(self.parse_relationships(data))
+        parsed_data.update(self.parse_metadata(result))
+        return parsed_data
+
     def parse(self, stream, media_type=None, parser_context=None):
         """
         Parses the incoming bytestream as JSON and returns the resulting data
@@ -79,6 +329,8 @@ class JSONParser(parsers.JSONParser):
             except ValueError:
                 result = {}
 
+        if not isinstance(result, dict):
+            raise ParseError('Received document is not a JSON object')
         data = result.get('data')
 
         if data:
@@ -96,26 +348,37 @@ class JSONParser(parsers.JSONParser):
 
                 return data
 
-            request = parser_context.get('request')
-
-            # Check for inconsistencies
-            resource_name = utils.get_resource_name(parser_context)
-            view = parser_context.get('view')
-            if data.get('type') != resource_name and request.method in ('PUT', 'POST', 'PATCH'):
-                raise exceptions.Conflict(
-                    "The resource object's type ({data_type}) is not the type "
-                    "that constitute the collection represented by the endpoint ({resource_type}).".format(
-                        data_type=data.get('type'),
-                        resource_type=resource_name
-                    )
-                )
-
-            # Construct the return data
-            parsed_data = {'id': data.get('id')}
-            parsed_data.update(self.parse_attributes(data))
-            parsed_data.update(self.parse_relationships(data))
-            parsed_data.update(self.parse_metadata(result))
-            return parsed_data
+            # A list of resource objects is parsed into a list, for bulk writes
+            if isinstance(data, list):
+                return [self.parse_resource_object(item, result, parser_context) for item in data]
+            return self.parse_resource_object(data, result, parser_context)
 
         else:
             raise ParseError('Received document does not contain primary data')
+
+
+class StreamingJSONParser(JSONParser):
+    """
+    Parses the primary data of a JSON API document lazily, returning an iterator over its parsed resource objects
+    instead of a list. The request body is read `chunk_size` bytes at a time as the iterator is consumed, and only
+    one resource object is decoded at a time, so that views can validate and write very large bulk payloads in
+    batches. Errors in the document are raised while iterating. The `meta` of the document is not read.
+    """
+    chunk_size = 64 * 1024
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self.iter_resource_objects(stream, parser_context)
+
+    def iter_resource_objects(self, stream, parser_context):
+        if hasattr(stream, 'raw_body'):
+            # The document of requests made by our zc_event event client is already decoded
+            data = super(StreamingJSONParser, self).parse(stream, parser_context=parser_context)
+            for item in (data if isinstance(data, list) else [data]):
+                yield item
+            return
+
+        scanner = PrimaryDataScanner(stream, self.chunk_size)
+        for data in scanner:
+            yield self.parse_resource_object(data, {}, parser_context)
+        if not scanner.found:
+            raise ParseError('Received document does not contain primary data')
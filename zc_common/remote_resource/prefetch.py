@@ -0,0 +1,140 @@
+"""
+Prefetching of included resources
+
+The renderer reads the relations to include from each resource it renders, which without any prefetching costs
+one or more queries per resource. `prefetch_included()` turns the `include` of a request into the
+`select_related()` and `prefetch_related()` calls that load those relations with the page instead.
+
+`get_only_fields()` maps the fields of a sparse fieldset to the columns to load with `only()`.
+"""
+import inflection
+from rest_framework import relations
+from rest_framework.serializers import BaseSerializer
+from rest_framework_json_api import utils
+
+from zc_common.remote_resource.relations import RemoteResourceField
+from zc_common.remote_resource.utils import get_model_field
+
+
+_lookups = {}
+MAX_LOOKUPS = 1000
+
+
+def clear_prefetch_lookups():
+    _lookups.clear()
+
+
+def get_prefetch_lookups(model, serializer_class, included_resources, context=None):
+    """
+    Returns a two-tuple of the `select_related()` and `prefetch_related()` lookups loading the local relations
+    that `included_resources` includes from resources of `model` serialized by `serializer_class`.
+
+    Paths made of single-valued relations are joined with `select_related()`. Paths crossing a multi-valued
+    relation are prefetched, after joining the single-valued relations leading to it. Remote resources and
+    relations that do not map to a model field are left to the renderer.
+
+    The serializers are instantiated with `context`, the serializer context of the view, since their fields may
+    depend on the request. The lookups are cached per serializer class and includes though, so such fields should
+    not change which relations are included.
+    """
+    key = (model, serializer_class, tuple(included_resources))
+    if key not in _lookups:
+        if len(_lookups) >= MAX_LOOKUPS:
+            _lookups.clear()
+        _lookups[key] = _get_prefetch_lookups(model, serializer_class, included_resources, context or {})
+    return _lookups[key]
+
+
+def _get_prefetch_lookups(model, serializer_class, included_resources, context):
+    select_related = []
+    prefetch_related = []
+
+    for included_resource in included_resources:
+        path = []
+        single_valued_path = []
+        current_model = model
+        current_serializer_class = serializer_class
+
+        for field_name in included_resource.split('.'):
+            field_name = inflection.underscore(field_name)
+            field = current_serializer_class(context=context).fields.get(field_name)
+            if field is None or isinstance(field, RemoteResourceField):
+                break
+            if isinstance(field, relations.ManyRelatedField) and \
+                    isinstance(field.child_relation, RemoteResourceField):
+                break
+
+            model_field = get_model_field(current_model, field.source)
+            if model_field is None or not model_field.is_relation or model_field.related_model is None:
+                # Not a relation, or a GenericForeignKey
+                break
+
+            path.append(field.source)
+            if (model_field.many_to_one or model_field.one_to_one) and len(single_valued_path) == len(path) - 1:
+                single_valued_path.append(path[-1])
+
+            if isinstance(field, BaseSerializer):
+                current_serializer_class = getattr(field, 'child', field).__class__
+            else:
+                current_serializer_class = utils.get_included_serializers(current_serializer_class).get(field_name)
+                if current_serializer_class is None:
+                    break
+            current_model = model_field.related_model
+
+        if single_valued_path:
+            select_related.append('__'.join(single_valued_path))
+        if len(path) > len(single_valued_path):
+            prefetch_related.append('__'.join(path))
+
+    return _remove_prefixes(select_related), _remove_prefixes(prefetch_related)
+
+
+def _remove_prefixes(lookups):
+    # `a__b` already loads `a`, so `a` does not need a lookup of its own
+    return [
+        lookup for lookup in sorted(set(lookups))
+        if not any(other.startswith(lookup + '__') for other in lookups)
+    ]
+
+
+def prefetch_included(queryset, serializer_class, included_resources, context=None):
+    """
+    Applies the lookups of `get_prefetch_lookups()` to `queryset`.
+    """
+    if not included_resources:
+        return queryset
+
+    select_related, prefetch_related = get_prefetch_lookups(
+        queryset.model, serializer_class, included_resources, context)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+def get_only_fields(model, serializer_class, field_names, context=None):
+    """
+    Returns the names of the model fields to load with `only()` for the serializer fields `field_names`, or None
+    when one of the serializer fields does not map to a model field. Such fields, like `SerializerMethodField`s,
+    may read any attribute of the instance, and deferring it would cost a query per resource.
+    """
+    fields = serializer_class(context=context or {}).fields
+    only_fields = [model._meta.pk.name]
+
+    for field_name in field_names:
+        field = fields.get(field_name)
+        if field is None:
+            continue
+        if isinstance(field, relations.HyperlinkedIdentityField):
+            if field.lookup_field != 'pk':
+                only_fields.append(field.lookup_field)
+            continue
+
+        model_field = get_model_field(model, field.source)
+        if model_field is None:
+            return None
+        if model_field.concrete and not model_field.many_to_many:
+            only_fields.append(model_field.name)
+
+    return only_fields
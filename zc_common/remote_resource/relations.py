@@ -3,9 +3,12 @@ import ujson
 
 import six
 from django.db.models.manager import BaseManager
+from django.db.models.query import QuerySet
+from rest_framework.serializers import ListSerializer
 from rest_framework_json_api.relations import ResourceRelatedField
 
 from zc_common.remote_resource.models import RemoteResource
+from zc_common.remote_resource.utils import get_model_field
 
 
 class RemoteResourceField(ResourceRelatedField):
@@ -40,13 +43,13 @@ class RemoteResourceField(ResourceRelatedField):
         # self.source is the field name; getattr(obj, self.source) returns the
         # RemoteResource object or RelatedManager in the case of a to-many relationship.
         related_obj = getattr(obj, self.source)
-        if related_obj and related_obj.id:
-            if isinstance(related_obj, BaseManager):
-                list_of_ids = related_obj.values_list('pk', flat=True)
-                query_parameters = 'filter[id__in]={}'.format(','.join([str(pk) for pk in list_of_ids]))
-                related_path = self.related_resource_path.format(pk=query_parameters)
-            else:
-                related_path = self.related_resource_path.format(pk=related_obj.id)
+        if isinstance(related_obj, BaseManager):
+            list_of_ids = self.get_related_ids(obj, related_obj)
+            query_parameters = 'filter[id__in]={}'.format(','.join([str(pk) for pk in list_of_ids]))
+            related_path = self.related_resource_path.format(pk=query_parameters)
+            related_link = request.build_absolute_uri(related_path)
+        elif related_obj and related_obj.id:
+            related_path = self.related_resource_path.format(pk=related_obj.id)
             related_link = request.build_absolute_uri(related_path)
         else:
             related_link = None
@@ -57,6 +60,53 @@ class RemoteResourceField(ResourceRelatedField):
             return_data.update({'related': related_link})
         return return_data
 
+    def get_related_ids(self, obj, manager):
+        """
+        Returns the pks of a to-many relation, read from the prefetched objects when the relation was prefetched.
+        Otherwise the pks are loaded for every resource serialized along with `obj` in a single query.
+        """
+        queryset = manager.all()
+        if queryset._result_cache is not None:
+            return [related.pk for related in queryset]
+
+        related_ids = self.get_page_related_ids(obj)
+        if related_ids is not None and obj.pk in related_ids:
+            return related_ids[obj.pk]
+        return list(manager.values_list('pk', flat=True))
+
+    def get_page_related_ids(self, obj):
+        """
+        Returns a dict mapping the pks of the resources serialized by the root list serializer to the pks of their
+        related objects, or None when `obj` is not serialized by a list serializer over model instances.
+        """
+        root = self.root
+        if not isinstance(root, ListSerializer) or not isinstance(root.instance, (list, tuple, QuerySet)):
+            return None
+
+        # The ids are loaded once per list serializer and relation
+        cache = getattr(root, '_remote_related_ids', None)
+        if cache is None:
+            cache = root._remote_related_ids = {}
+        if self.source not in cache:
+            model = obj.__class__
+            model_field = get_model_field(model, self.source)
+            if model_field is None or not model_field.is_relation or model_field.related_model is None:
+                cache[self.source] = None
+            else:
+                pks = [instance.pk for instance in root.instance if isinstance(instance, model)]
+                related_ids = cache[self.source] = {pk: [] for pk in pks}
+
+                # Query the related model through its default manager, as the related manager of each resource
+                # would, so that the filtering and ordering of that manager apply
+                if model_field.auto_created and not model_field.concrete:
+                    lookup = model_field.field.name
+                else:
+                    lookup = model_field.related_query_name()
+                rows = model_field.related_model._default_manager.filter(**{'{}__in'.format(lookup): pks})
+                for pk, related_pk in rows.values_list(lookup, 'pk'):
+                    related_ids[pk].append(related_pk)
+        return cache[self.source]
+
     def to_internal_value(self, data):
         if isinstance(data, six.text_type):
             try:
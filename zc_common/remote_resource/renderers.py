@@ -3,12 +3,13 @@ Renderers
 """
 import copy
 from collections import OrderedDict
+import json
+import logging
 import os
-import ujson
 
 import inflection
 from django.db.models import Manager
-from django.utils import six
+from django.utils import encoding, six
 from rest_framework import relations
 from rest_framework.serializers import BaseSerializer, Serializer, ListSerializer
 from rest_framework.settings import api_settings
@@ -16,11 +17,16 @@ from rest_framework.settings import api_settings
 from rest_framework_json_api import utils
 from rest_framework_json_api import renderers
 
+# The include errors used to live in this module and are still imported from here by services
+from zc_common.remote_resource.includes import (  # noqa: F401
+    RemoteIncludeCollector, RemoteResourceIncludeError, RemoteResourceIncludeTimeoutError)
 from zc_common.remote_resource.relations import RemoteResourceField
 from zc_common.remote_resource import utils as zc_common_utils
-from zc_events.exceptions import RequestTimeout
+from zc_common.settings import zc_settings
 
 
+logger = logging.getLogger('django')
+
 core_module_name = os.environ.get('DJANGO_SETTINGS_MODULE').split('.')[0]
 core_module = __import__(core_module_name)
 event_client = core_module.event_client
@@ -34,35 +40,48 @@ def key_formatter():
         return utils.format_keys
 
 
-class RemoteResourceIncludeError(Exception):
-
-    def __init__(self, field, data=None):
-        self.field = field
-        self.message = "There was an error including the field {}".format(field)
-
-        data['meta'] = {'include_field': field}
-        self.data = [data]
-
-    def __str__(self):
-        return self.message
+class SerializerPlan(object):
+    """
+    The classification of a serializer's fields that the renderer needs for every resource it renders, computed
+    once per serializer class and set of field names and reused across resources and requests.
+    """
+    max_plans = 1000
+    _plans = {}
 
+    def __init__(self, fields):
+        self.serializer_class = fields.serializer.__class__
 
-class RemoteResourceIncludeTimeoutError(RemoteResourceIncludeError):
+        # (field name, read only) of the fields rendered as attributes
+        self.attribute_fields = []
+        # Names of the fields that may be included, that is the relations and nested serializers
+        self.relation_fields = []
 
-    def __init__(self, field):
-        self.field = field
-        self.message = "Timeout error requesting remote resource {}".format(field)
+        for field_name, field in six.iteritems(fields):
+            if isinstance(field, (relations.RelatedField, relations.ManyRelatedField, BaseSerializer)):
+                if field_name != api_settings.URL_FIELD_NAME:
+                    self.relation_fields.append(field_name)
+            elif field_name != 'id' and not field.write_only:
+                # ID is always provided in the root of JSON API so remove it from attributes,
+                # and don't output a key for write only fields
+                self.attribute_fields.append((field_name, field.read_only))
+
+        self.included_serializers = utils.get_included_serializers(fields.serializer)
+
+    @property
+    def resource_type(self):
+        if not hasattr(self, '_resource_type'):
+            self._resource_type = utils.get_resource_type_from_serializer(self.serializer_class)
+        return self._resource_type
 
-        self.data = [{
-            "status": "503",
-            "source": {
-                "pointer": "/data"
-            },
-            "meta": {
-                "include_field": field,
-            },
-            "detail": self.message
-        }]
+    @classmethod
+    def for_fields(cls, fields):
+        key = (fields.serializer.__class__, tuple(fields))
+        plan = cls._plans.get(key)
+        if plan is None:
+            if len(cls._plans) >= cls.max_plans:
+                cls._plans.clear()
+            plan = cls._plans[key] = cls(fields)
+        return plan
 
 
 class JSONRenderer(renderers.JSONRenderer):
@@ -70,35 +89,25 @@ class JSONRenderer(renderers.JSONRenderer):
     This is s modification of renderers in (v 2.2)
     https://github.com/django-json-api/django-rest-framework-json-api
     """
+    # Hit and miss counts of the remote include memo for the last rendered response, for metrics
+    remote_include_stats = None
+
     @classmethod
     def extract_attributes(cls, fields, resource):
         """
         @amberylx 2020-01-10: Copied from djangorestframework-jsonapi v3.0.0 in order to override the call to
         `utils.format_field_names(data)` to our own function of `format_keys()`, which is a copy of the library's
         old (pre-v3.0) function.
+
+        The fields to render are looked up from the cached `SerializerPlan` rather than classified for every resource.
         """
         data = OrderedDict()
-        for field_name, field in iter(fields.items()):
-            # ID is always provided in the root of JSON API so remove it from attributes
-            if field_name == 'id':
-                continue
-            # don't output a key for write only fields
-            if fields[field_name].write_only:
-                continue
-            # Skip fields with relations
-            if isinstance(
-                    field, (relations.RelatedField, relations.ManyRelatedField, BaseSerializer)
-            ):
-                continue
-
+        for field_name, read_only in SerializerPlan.for_fields(fields).attribute_fields:
             # Skip read_only attribute fields when `resource` is an empty
             # serializer. Prevents the "Raw Data" form of the browsable API
             # from rendering `"foo": null` for read only fields
-            try:
-                resource[field_name]
-            except KeyError:
-                if fields[field_name].read_only:
-                    continue
+            if read_only and field_name not in resource:
+                continue
 
             data.update({
                 field_name: resource.get(field_name)
@@ -107,26 +116,41 @@ class JSONRenderer(renderers.JSONRenderer):
         return key_formatter()(data)
 
     @classmethod
-    def extract_included(cls, request, fields, resource, resource_instance, included_resources):
+    def extract_included(cls, request, fields, resource, resource_instance, included_resources,
+                         remote_includes=None, included_keys=None, fieldsets=None):
         # this function may be called with an empty record (example: Browsable Interface)
         if not resource_instance:
             return
 
+        # `included_keys` holds the (type, id) of the resources included so far, and their (type, id, includes)
+        # once their own included resources were extracted for those includes. Callers rendering several
+        # resources share it so that a resource many of them relate to is only serialized once.
+        if included_keys is None:
+            included_keys = set()
+
+        # The sparse fieldsets requested with `fields[type]=`, by resource type
+        fieldsets = fieldsets or {}
+
+        # Remote includes are only registered with the collector while walking the resources. When no collector
+        # is handed down by the caller they are fetched before returning, otherwise the caller fetches them.
+        fetch_remote_includes = remote_includes is None
+        if fetch_remote_includes:
+            remote_includes = RemoteIncludeCollector(request, event_client)
+
         included_data = list()
+        if not included_resources:
+            return included_data
+
         current_serializer = fields.serializer
         context = current_serializer.context
-        included_serializers = utils.get_included_serializers(current_serializer)
+        plan = SerializerPlan.for_fields(fields)
+        included_serializers = plan.included_serializers
         included_resources = copy.copy(included_resources)
         included_resources = [inflection.underscore(value) for value in included_resources]
 
-        for field_name, field in six.iteritems(fields):
-            # Skip URL field
-            if field_name == api_settings.URL_FIELD_NAME:
-                continue
-
-            # Skip fields without relations or serialized data
-            if not isinstance(field, (relations.RelatedField, relations.ManyRelatedField, BaseSerializer)):
-                continue
+        # Only relations and nested serializers can be included, the URL field is skipped by the plan
+        for field_name in plan.relation_fields:
+            field = fields[field_name]
 
             try:
                 included_resources.remove(field_name)
@@ -157,27 +181,9 @@ class JSONRenderer(renderers.JSONRenderer):
             serializer_data = resource.get(field_name)
 
             if isinstance(field, RemoteResourceField):
-                user_id = getattr(request.user, 'id', None)
-                roles = request.user.roles
-                pk = serializer_data.get('id')
-
-                include = ",".join(new_included_resources)
-                try:
-                    remote_resource = event_client.get_remote_resource_data(
-                        field_name, pk=pk, user_id=user_id,
-                        include=include, page_size=1000, roles=roles)
-
-                    body = ujson.loads(remote_resource['body'])
-
-                    if 400 <= remote_resource['status'] < 600:
-                        raise RemoteResourceIncludeError(field_name, body["errors"][0])
-                except RequestTimeout:
-                    raise RemoteResourceIncludeTimeoutError(field_name)
-
-                included_data.append(body['data'])
-
-                if body.get('included'):
-                    included_data.extend(body['included'])
+                if serializer_data:
+                    include = ",".join(new_included_resources)
+                    remote_includes.add(field_name, serializer_data.get('id'), include)
 
                 # We continue here since RemoteResourceField inherits
                 # form ResourceRelatedField which is a RelatedField
@@ -185,7 +191,10 @@ class JSONRenderer(renderers.JSONRenderer):
 
             if isinstance(field, relations.ManyRelatedField):
                 serializer_class = included_serializers[field_name]
+                relation_instance = cls.exclude_included(
+                    relation_instance, serializer_class, new_included_resources, included_keys)
                 field = serializer_class(relation_instance, many=True, context=context)
+                cls.restrict_included_fields(field, serializer_class, fieldsets, new_included_resources)
                 serializer_data = field.data
 
             if isinstance(field, relations.RelatedField):
@@ -194,16 +203,23 @@ class JSONRenderer(renderers.JSONRenderer):
 
                 many = field._kwargs.get('child_relation', None) is not None
                 serializer_class = included_serializers[field_name]
+                if many:
+                    relation_instance = cls.exclude_included(
+                        relation_instance, serializer_class, new_included_resources, included_keys)
+                elif not cls.exclude_included([relation_instance], serializer_class, new_included_resources,
+                                              included_keys):
+                    continue
                 field = serializer_class(relation_instance, many=many, context=context)
+                cls.restrict_included_fields(field, serializer_class, fieldsets, new_included_resources)
                 serializer_data = field.data
 
             if isinstance(field, ListSerializer):
                 serializer = field.child
-                relation_type = utils.get_resource_type_from_serializer(serializer)
                 relation_queryset = list(relation_instance)
 
                 # Get the serializer fields
                 serializer_fields = utils.get_serializer_fields(serializer)
+                relation_type = SerializerPlan.for_fields(serializer_fields).resource_type
                 if serializer_data:
                     for position in range(len(serializer_data)):
                         serializer_resource = serializer_data[position]
@@ -212,38 +228,115 @@ class JSONRenderer(renderers.JSONRenderer):
                             relation_type or
                             utils.get_resource_type_from_instance(nested_resource_instance)
                         )
+                        key, include_key = cls.get_included_keys(
+                            resource_type, nested_resource_instance, new_included_resources)
+                        if key not in included_keys:
+                            included_keys.add(key)
+                            included_data.append(
+                                cls.build_json_resource_obj(
+                                    serializer_fields, serializer_resource, nested_resource_instance, resource_type
+                                )
+                            )
+                        if new_included_resources and include_key not in included_keys:
+                            included_keys.add(include_key)
+                            included_data.extend(
+                                cls.extract_included(
+                                    request, serializer_fields, serializer_resource,
+                                    nested_resource_instance, new_included_resources,
+                                    remote_includes=remote_includes, included_keys=included_keys,
+                                    fieldsets=fieldsets
+                                )
+                            )
+
+            if isinstance(field, Serializer):
+
+                # Get the serializer fields
+                serializer_fields = utils.get_serializer_fields(field)
+                relation_type = SerializerPlan.for_fields(serializer_fields).resource_type
+                if serializer_data:
+                    key, include_key = cls.get_included_keys(relation_type, relation_instance, new_included_resources)
+                    if key not in included_keys:
+                        included_keys.add(key)
                         included_data.append(
                             cls.build_json_resource_obj(
-                                serializer_fields, serializer_resource, nested_resource_instance, resource_type
-                            )
+                                serializer_fields, serializer_data,
+                                relation_instance, relation_type)
                         )
+                    if new_included_resources and include_key not in included_keys:
+                        included_keys.add(include_key)
                         included_data.extend(
                             cls.extract_included(
-                                request, serializer_fields, serializer_resource,
-                                nested_resource_instance, new_included_resources
+                                request, serializer_fields, serializer_data,
+                                relation_instance, new_included_resources,
+                                remote_includes=remote_includes, included_keys=included_keys,
+                                fieldsets=fieldsets
                             )
                         )
 
-            if isinstance(field, Serializer):
+        if fetch_remote_includes:
+            included_data.extend(key_formatter()(remote_includes.fetch()))
 
-                relation_type = utils.get_resource_type_from_serializer(field)
+        # Every included document is already formatted: the attributes and relationships of local documents
+        # while building them, remote documents right after fetching them. Formatting them again at every level
+        # of nesting would only rebuild them, their member names ('type', 'id', 'attributes', ...) are plain
+        # lower case words.
+        return included_data
 
-                # Get the serializer fields
-                serializer_fields = utils.get_serializer_fields(field)
-                if serializer_data:
-                    included_data.append(
-                        cls.build_json_resource_obj(
-                            serializer_fields, serializer_data,
-                            relation_instance, relation_type)
-                    )
-                    included_data.extend(
-                        cls.extract_included(
-                            request, serializer_fields, serializer_data,
-                            relation_instance, new_included_resources
-                        )
-                    )
+    @staticmethod
+    def get_included_keys(resource_type, resource_instance, included_resources):
+        """
+        Returns the keys marking a resource as included, and as having had its own `included_resources`
+        extracted.
+        """
+        key = (resource_type, encoding.force_text(resource_instance.pk))
+        return key, key + (tuple(included_resources),)
+
+    @classmethod
+    def exclude_included(cls, instances, serializer_class, included_resources, included_keys):
+        """
+        Returns the instances that still need to be serialized to be included: the ones that are not included
+        yet, and the ones that are but still have resources of their own to include for `included_resources`.
+        """
+        relation_type = utils.get_resource_type_from_serializer(serializer_class)
+
+        remaining_instances = []
+        for instance in instances:
+            resource_type = relation_type or utils.get_resource_type_from_instance(instance)
+            key, include_key = cls.get_included_keys(resource_type, instance, included_resources)
+            if key not in included_keys or (included_resources and include_key not in included_keys):
+                remaining_instances.append(instance)
+        return remaining_instances
+
+    @classmethod
+    def restrict_included_fields(cls, serializer, serializer_class, fieldsets, included_resources):
+        """
+        Drops the fields of a serializer of included resources that their sparse fieldset does not request, before
+        they are computed.
+        """
+        if not fieldsets:
+            return
 
-        return key_formatter()(included_data)
+        fieldset = fieldsets.get(utils.get_resource_type_from_serializer(serializer_class))
+        if fieldset is not None:
+            field_names = zc_common_utils.get_sparse_field_names(fieldset, included_resources)
+            zc_common_utils.restrict_serializer_fields(serializer, field_names)
+
+    @staticmethod
+    def apply_sparse_fieldset(resource_obj, fieldsets):
+        """
+        Returns the resource object with only the attributes and relationships requested by the sparse fieldset of
+        its type. The resource object is copied rather than changed, since remote documents may be cached.
+        """
+        fieldset = fieldsets.get(resource_obj.get('type')) if fieldsets else None
+        if fieldset is None:
+            return resource_obj
+
+        resource_obj = copy.copy(resource_obj)
+        for key in ('attributes', 'relationships'):
+            if key in resource_obj:
+                resource_obj[key] = OrderedDict(
+                    (name, value) for name, value in resource_obj[key].items() if name in fieldset)
+        return resource_obj
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
 
@@ -289,6 +382,7 @@ class JSONRenderer(renderers.JSONRenderer):
         serializer = getattr(serializer_data, 'serializer', None)
 
         included_resources = utils.get_included_resources(request, serializer)
+        fieldsets = zc_common_utils.get_sparse_fieldsets(request)
 
         if serializer is not None:
 
@@ -298,6 +392,9 @@ class JSONRenderer(renderers.JSONRenderer):
             # Extract root meta for any type of serializer
             json_api_meta.update(self.extract_root_meta(serializer, serializer_data))
 
+            remote_includes = RemoteIncludeCollector(request, event_client)
+            included_keys = set()
+
             try:
                 if getattr(serializer, 'many', False):
                     json_api_data = list()
@@ -314,7 +411,9 @@ class JSONRenderer(renderers.JSONRenderer):
                         json_api_data.append(json_resource_obj)
 
                         included = self.extract_included(request, fields, resource,
-                                                         resource_instance, included_resources)
+                                                         resource_instance, included_resources,
+                                                         remote_includes=remote_includes,
+                                                         included_keys=included_keys, fieldsets=fieldsets)
                         if included:
                             json_api_included.extend(included)
                 else:
@@ -327,11 +426,18 @@ class JSONRenderer(renderers.JSONRenderer):
                         json_api_data.update({'meta': key_formatter()(meta)})
 
                     included = self.extract_included(request, fields, serializer_data,
-                                                     resource_instance, included_resources)
+                                                     resource_instance, included_resources,
+                                                     remote_includes=remote_includes,
+                                                     included_keys=included_keys, fieldsets=fieldsets)
                     if included:
                         json_api_included.extend(included)
+
+                # Fetch the remote includes of every resource at once, now that all of them are known
+                json_api_included.extend(key_formatter()(remote_includes.fetch()))
             except RemoteResourceIncludeError as e:
                 return self.render_errors(e.data, accepted_media_type)
+            finally:
+                self.record_remote_include_stats(remote_includes, json_api_meta)
 
         # Make sure we render data in a specific order
         render_data = OrderedDict()
@@ -344,6 +450,10 @@ class JSONRenderer(renderers.JSONRenderer):
             render_data['data'] = None
             render_data['links'] = json_api_data
         else:
+            if fieldsets and isinstance(json_api_data, list):
+                json_api_data = [self.apply_sparse_fieldset(item, fieldsets) for item in json_api_data]
+            elif fieldsets and isinstance(json_api_data, dict):
+                json_api_data = self.apply_sparse_fieldset(json_api_data, fieldsets)
             render_data['data'] = json_api_data
 
         if len(json_api_included) > 0:
@@ -354,7 +464,7 @@ class JSONRenderer(renderers.JSONRenderer):
                 type_tuple = tuple((included_dict['type'], included_dict['id']))
                 if type_tuple not in seen:
                     seen.add(type_tuple)
-                    unique_compound_documents.append(included_dict)
+                    unique_compound_documents.append(self.apply_sparse_fieldset(included_dict, fieldsets))
 
             # Sort the items by type then by id
             render_data['included'] = sorted(unique_compound_documents, key=lambda item: (item['type'], item['id']))
@@ -365,3 +475,81 @@ class JSONRenderer(renderers.JSONRenderer):
         return super(renderers.JSONRenderer, self).render(
             render_data, accepted_media_type, renderer_context
         )
+
+    def render_stream(self, serializer, links=None, meta=None, renderer_context=None):
+        """
+        Renders the resources of a list serializer as a JSON API document, yielding the document in chunks.
+        Each resource is serialized, rendered and yielded on its own, followed by the included documents and
+        the meta. Used with a `StreamingHttpResponse` and a lazily evaluated instance such as
+        `queryset.iterator()`, the memory held at once is bounded by a single resource and the included
+        documents rather than the whole document.
+
+        Unlike `render()`, the serializer's root meta is not rendered, since it needs every resource at once,
+        and an error including a remote resource aborts the stream since the response status is already sent.
+        """
+        renderer_context = renderer_context or {}
+        request = renderer_context.get('request', None)
+        resource_name = utils.get_resource_name(renderer_context)
+
+        fields = utils.get_serializer_fields(serializer)
+        included_resources = utils.get_included_resources(request, serializer)
+        fieldsets = zc_common_utils.get_sparse_fieldsets(request)
+        remote_includes = RemoteIncludeCollector(request, event_client)
+        included_keys = set()
+        included = OrderedDict()
+
+        if links:
+            yield '{"links":' + self._dumps(links) + ',"data":['
+        else:
+            yield '{"data":['
+
+        try:
+            for position, resource_instance in enumerate(serializer.instance):
+                resource = serializer.child.to_representation(resource_instance)
+
+                json_resource_obj = self.build_json_resource_obj(fields, resource, resource_instance, resource_name)
+                resource_meta = self.extract_meta(serializer, resource)
+                if resource_meta:
+                    json_resource_obj.update({'meta': key_formatter()(resource_meta)})
+                json_resource_obj = self.apply_sparse_fieldset(json_resource_obj, fieldsets)
+                yield (',' if position else '') + self._dumps(json_resource_obj)
+
+                included_data = self.extract_included(request, fields, resource, resource_instance,
+                                                      included_resources, remote_includes=remote_includes,
+                                                      included_keys=included_keys, fieldsets=fieldsets)
+                for included_dict in included_data or []:
+                    included.setdefault((included_dict['type'], included_dict['id']), included_dict)
+
+            yield ']'
+
+            for included_dict in key_formatter()(remote_includes.fetch()):
+                included.setdefault((included_dict['type'], included_dict['id']), included_dict)
+        finally:
+            meta = dict(meta or {})
+            self.record_remote_include_stats(remote_includes, meta)
+
+        if included:
+            # Sort the items by type then by id, as `render()` does
+            yield ',"included":' + self._dumps(
+                [self.apply_sparse_fieldset(included[key], fieldsets) for key in sorted(included)])
+
+        if meta:
+            yield ',"meta":' + self._dumps(key_formatter()(meta))
+
+        yield '}'
+
+    def record_remote_include_stats(self, remote_includes, meta):
+        """
+        Keeps the hit and miss counts of the remote include memo of a response and logs them. With the
+        `REMOTE_INCLUDE_STATS_IN_META` setting, they are also rendered in the `meta` of the response.
+        """
+        stats = self.remote_include_stats = remote_includes.stats()
+        if not (stats['hits'] or stats['misses']):
+            return
+
+        logger.debug("Remote includes: %(hits)s hits, %(misses)s misses", stats)
+        if zc_settings.REMOTE_INCLUDE_STATS_IN_META:
+            meta['remote_includes'] = stats
+
+    def _dumps(self, data):
+        return json.dumps(data, cls=self.encoder_class, ensure_ascii=self.ensure_ascii, separators=(',', ':'))
@@ -1,6 +1,9 @@
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, router
+from django.utils import six
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from rest_framework_json_api.utils import (
     get_resource_type_from_model, get_resource_type_from_instance)
 
@@ -56,3 +59,133 @@ class IncludedDict(dict):
 
 class RemoteResourceSerializer(object):
     included_serializers = IncludedDict()
+
+
+def can_return_ids_from_bulk_insert(model):
+    features = connections[router.db_for_write(model)].features
+    # Renamed to `can_return_rows_from_bulk_insert` in Django 3.0
+    return (getattr(features, 'can_return_ids_from_bulk_insert', False) or
+            getattr(features, 'can_return_rows_from_bulk_insert', False))
+
+
+def overrides(serializer, method_name):
+    """
+    Returns whether the class of a model serializer overrides one of ModelSerializer's methods.
+    """
+    method = six.get_unbound_function(getattr(serializer.__class__, method_name))
+    return method is not six.get_unbound_function(getattr(serializers.ModelSerializer, method_name))
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    A list serializer of model serializers writing all of its resources at once. Resources are created with
+    `bulk_create()`, and updated with `bulk_update()` when Django has it, or otherwise one after the other. As
+    with any bulk write, `save()` is not called and no signals are sent for the created resources.
+
+    Child serializers overriding `create()` or `update()` have their own method called for each resource.
+    Resources are also created one by one when the database can't return the ids of inserted rows and their
+    model has no default primary key, since their ids are needed in the response.
+
+    To update resources, pass the instances to update as `instance`: each resource object of the data is
+    validated against the instance with the same id.
+    """
+
+    batch_size = 500
+
+    def __init__(self, *args, **kwargs):
+        super(BulkListSerializer, self).__init__(*args, **kwargs)
+        self.instances_to_update = []
+
+    def to_internal_value(self, data):
+        if self.instance is None:
+            return super(BulkListSerializer, self).to_internal_value(data)
+
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(input_type=type(data).__name__)
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]})
+
+        instances = dict((six.text_type(instance.pk), instance) for instance in self.instance)
+
+        ret = []
+        errors = []
+        self.instances_to_update = []
+        try:
+            for item in data:
+                # Validate the resource against the instance it updates, for instance for unique validators
+                self.child.instance = instances.get(six.text_type(item.get('id')))
+                if self.child.instance is None:
+                    errors.append({'id': [_('Invalid pk "{pk_value}" - object does not exist.').format(
+                        pk_value=item.get('id'))]})
+                    continue
+
+                try:
+                    validated = self.child.run_validation(item)
+                except serializers.ValidationError as exc:
+                    errors.append(exc.detail)
+                else:
+                    ret.append(validated)
+                    self.instances_to_update.append(self.child.instance)
+                    errors.append({})
+        finally:
+            self.child.instance = None
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return ret
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        if overrides(self.child, 'create'):
+            return super(BulkListSerializer, self).create(validated_data)
+
+        many_to_many_names = set(field.name for field in model._meta.many_to_many)
+        instances = []
+        many_to_many = []
+        for attrs in validated_data:
+            attrs = dict(attrs)
+            many_to_many.append(dict((name, attrs.pop(name)) for name in many_to_many_names if name in attrs))
+            instances.append(model(**attrs))
+
+        if can_return_ids_from_bulk_insert(model) or all(instance.pk is not None for instance in instances):
+            model._default_manager.bulk_create(instances, batch_size=self.batch_size)
+        else:
+            for instance in instances:
+                instance.save()
+
+        self.set_many_to_many(instances, many_to_many)
+        return instances
+
+    def update(self, instance, validated_data):
+        instances = self.instances_to_update
+        if overrides(self.child, 'update'):
+            return [self.child.update(instance, attrs) for instance, attrs in zip(instances, validated_data)]
+
+        model = self.child.Meta.model
+        many_to_many_names = set(field.name for field in model._meta.many_to_many)
+        many_to_many = []
+        update_fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            many_to_many.append(dict((name, value) for name, value in attrs.items() if name in many_to_many_names))
+            for name, value in attrs.items():
+                if name not in many_to_many_names:
+                    setattr(instance, name, value)
+                    update_fields.add(name)
+
+        if update_fields:
+            manager = model._default_manager
+            if hasattr(manager, 'bulk_update'):
+                # Django >= 2.2
+                manager.bulk_update(instances, list(update_fields), batch_size=self.batch_size)
+            else:
+                for instance, attrs in zip(instances, validated_data):
+                    instance.save(update_fields=[name for name in attrs if name not in many_to_many_names])
+
+        self.set_many_to_many(instances, many_to_many)
+        return instances
+
+    @staticmethod
+    def set_many_to_many(instances, many_to_many):
+        for instance, relations in zip(instances, many_to_many):
+            for name, value in relations.items():
+                getattr(instance, name).set(value)
@@ -3,9 +3,50 @@ from collections import OrderedDict
 import inflection
 
 from django.conf import settings
+from django.db.models import FieldDoesNotExist
+from rest_framework.settings import api_settings
+
+
+# The formatted keys are memoized per format type. An API only uses a limited number of distinct keys, and the
+# memo is cleared if it ever grows past this size.
+FORMATTED_KEYS_MAX_SIZE = 10000
+
+_formatted_keys = {}
+
+
+def _format_key(key, format_type):
+    if format_type == 'dasherize':
+        # inflection can't dasherize camelCase
+        return inflection.dasherize(inflection.underscore(key))
+    elif format_type == 'camelize':
+        return inflection.camelize(key, False)
+    elif format_type == 'capitalize':
+        return inflection.camelize(key)
+    return inflection.underscore(key)
+
+
+def format_key(key, format_type):
+    """
+    Formats a single key with inflection, memoizing the result per format type.
+    """
+    formatted_keys = _formatted_keys.get(format_type)
+    if formatted_keys is None:
+        formatted_keys = _formatted_keys[format_type] = {}
+
+    try:
+        return formatted_keys[key]
+    except KeyError:
+        if len(formatted_keys) >= FORMATTED_KEYS_MAX_SIZE:
+            formatted_keys.clear()
+        formatted = formatted_keys[key] = _format_key(key, format_type)
+        return formatted
 
 
 def format_keys(obj, format_type=None):
+    """
+    Formats the keys of a dict, or of the dicts in a list, according to `format_type`, which defaults to the
+    `JSON_API_FORMAT_FIELD_NAMES` setting.
+    """
     if format_type is None:
         format_type = getattr(settings, 'JSON_API_FORMAT_FIELD_NAMES', False)
 
@@ -13,20 +54,7 @@ def format_keys(obj, format_type=None):
         if isinstance(obj, dict):
             formatted = OrderedDict()
             for key, value in obj.items():
-                if format_type == 'dasherize':
-                    # inflection can't dasherize camelCase
-                    key = inflection.underscore(key)
-                    formatted[inflection.dasherize(key)] \
-                        = format_keys(value, format_type)
-                elif format_type == 'camelize':
-                    formatted[inflection.camelize(key, False)] \
-                        = format_keys(value, format_type)
-                elif format_type == 'capitalize':
-                    formatted[inflection.camelize(key)] \
-                        = format_keys(value, format_type)
-                elif format_type == 'underscore':
-                    formatted[inflection.underscore(key)] \
-                        = format_keys(value, format_type)
+                formatted[format_key(key, format_type)] = format_keys(value, format_type)
             return formatted
         if isinstance(obj, list):
             return [format_keys(item, format_type) for item in obj]
@@ -34,3 +62,54 @@ def format_keys(obj, format_type=None):
             return obj
     else:
         return obj
+
+
+def get_model_field(model, name):
+    """
+    Returns the field of `model` accessed as `name`, which for reverse relations is the name of their accessor,
+    or None.
+    """
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        for field in model._meta.get_fields():
+            if field.auto_created and not field.concrete and field.get_accessor_name() == name:
+                return field
+    return None
+
+
+def get_sparse_fieldsets(request):
+    """
+    Returns a dict mapping resource types to the set of field names requested for them with `fields[type]=a,b`.
+    The field names are kept as given, that is formatted like the keys of the rendered documents.
+    """
+    fieldsets = {}
+    if request is None:
+        return fieldsets
+
+    for param, value in request.query_params.items():
+        if param.startswith('fields[') and param.endswith(']'):
+            fieldsets[param[len('fields['):-1]] = set(name for name in value.split(',') if name)
+    return fieldsets
+
+
+def get_sparse_field_names(fieldset, included_resources=()):
+    """
+    Returns the names of the serializer fields to keep for a sparse fieldset: the requested fields, the fields
+    through which `included_resources` are included, the id and the url.
+    """
+    field_names = set(inflection.underscore(name) for name in fieldset)
+    field_names.update(inflection.underscore(path.split('.')[0]) for path in included_resources)
+    field_names.update(('id', api_settings.URL_FIELD_NAME))
+    return field_names
+
+
+def restrict_serializer_fields(serializer, field_names):
+    """
+    Drops the fields of a serializer, or of the child of a list serializer, that are not in `field_names`, so that
+    they are not computed at all.
+    """
+    serializer = getattr(serializer, 'child', serializer)
+    for field_name in list(serializer.fields):
+        if field_name not in field_names:
+            serializer.fields.pop(field_name)
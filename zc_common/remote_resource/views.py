@@ -1,13 +1,163 @@
+import copy
+from itertools import islice
+
+from django.db import transaction
 from django.db.models import CharField, TextField
+from django.http import QueryDict, StreamingHttpResponse
 from django.db.models import Model
 from django.db.models.manager import Manager
 from django.db.models.query import QuerySet
-from rest_framework import viewsets
-from rest_framework.exceptions import MethodNotAllowed
+from django.utils import six
+from rest_framework import parsers, permissions, status, viewsets
+from rest_framework.exceptions import MethodNotAllowed, ParseError
+from rest_framework.request import clone_request
+from rest_framework.response import Response
+from rest_framework_json_api import utils
 from rest_framework_json_api.views import RelationshipView as OldRelView
 
 from zc_common.remote_resource.models import RemoteResource
-from zc_common.remote_resource.serializers import ResourceIdentifierObjectSerializer
+from zc_common.remote_resource.parsers import StreamingJSONParser
+from zc_common.remote_resource.prefetch import get_only_fields, prefetch_included
+from zc_common.remote_resource.utils import get_sparse_field_names, get_sparse_fieldsets, restrict_serializer_fields
+from zc_common.remote_resource.serializers import BulkListSerializer, ResourceIdentifierObjectSerializer
+
+
+# list_route() was replaced by action() in rest_framework 3.8
+try:
+    from rest_framework.decorators import action
+except ImportError:
+    from rest_framework.decorators import list_route
+    action = None
+
+
+def collection_route(**kwargs):
+    if action is not None:
+        return action(detail=False, **kwargs)
+    return list_route(**kwargs)
+
+
+# The parameters of a list request, besides `filter` and `fields`, that a query request may carry in its body
+QUERY_PARAMS = ('include', 'sort', 'page', 'page_size', 'count')
+
+
+def format_query_value(value):
+    if isinstance(value, (list, tuple)):
+        return ','.join(six.text_type(item) for item in value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return six.text_type(value)
+
+
+def get_query_params(body):
+    """
+    Translates the JSON body of a query request into the query parameters of a list request, so that they are
+    handled by the same filter backends, paginator and renderer. For instance:
+
+        {"filter": {"id__in": [1, 2, 3], "active": true}, "include": ["company"], "page": 2}
+
+    is translated into `?filter[id__in]=1,2,3&filter[active]=true&include=company&page=2`.
+    """
+    if not isinstance(body, dict):
+        raise ParseError('The body of a query must be a JSON object')
+
+    query_params = QueryDict('', mutable=True)
+    for param in ('filter', 'fields'):
+        values = body.get(param) or {}
+        if not isinstance(values, dict):
+            raise ParseError('The {} of a query must be a JSON object'.format(param))
+        for name, value in values.items():
+            query_params['{}[{}]'.format(param, name)] = format_query_value(value)
+
+    for param in QUERY_PARAMS:
+        if body.get(param) is not None:
+            query_params[param] = format_query_value(body[param])
+    return query_params
+
+
+def clone_query_request(request, query_params, path):
+    """
+    Returns a GET request to `path` with the query parameters `query_params`, sharing the user, parsed body and
+    negotiated renderer of `request`, which is left untouched.
+    """
+    http_request = copy.copy(request._request)
+    http_request.GET = query_params
+    http_request.path = path
+    http_request.META = dict(http_request.META, QUERY_STRING=query_params.urlencode())
+
+    query_request = clone_request(request, 'GET')
+    query_request._request = http_request
+    return query_request
+
+
+def iterate_in_slices(queryset, size):
+    """
+    Iterates over a queryset one slice of `size` instances at a time. Unlike `queryset.iterator()`, each slice
+    is loaded with the `prefetch_related()` lookups of the queryset, while only one slice is held at once.
+    """
+    start = 0
+    while True:
+        instances = list(queryset[start:start + size])
+        for instance in instances:
+            yield instance
+        if len(instances) < size:
+            return
+        start += size
+
+
+def get_collection_path(path, url_path='query'):
+    """
+    Returns the path of the collection of a collection action, such as `/people/` for `/people/query/`.
+    """
+    stripped = path.rstrip('/')
+    if not stripped.endswith('/' + url_path):
+        return path
+    collection_path = stripped[:-len(url_path) - 1]
+    return collection_path + '/' if path.endswith('/') else collection_path
+
+
+_filter_fields = {}
+
+
+def get_filter_fields(model):
+    """
+    Returns the filter fields of `ModelViewSet`s for a model, computed once per model. The returned dict is
+    shared and must not be changed.
+    """
+    try:
+        return _filter_fields[model]
+    except KeyError:
+        pass
+
+    return_fields = {}
+
+    fields = model._meta.get_fields()
+    for field in fields:
+        # For backwards compatibility GenericForeignKey should not be
+        # included in the results.
+        if field.is_relation and field.many_to_one and field.related_model is None:
+            continue
+        # Relations to child proxy models should not be included.
+        if (field.model != model._meta.model and
+                field.model._meta.concrete_model == model._meta.concrete_model):
+            continue
+
+        name = field.attname if hasattr(field, 'attname') else field.name
+        if hasattr(field, 'primary_key') and field.primary_key:
+            return_fields['id'] = ['in', 'exact']
+        elif CharField in field.__class__.__mro__ or TextField in field.__class__.__mro__:
+            return_fields[name] = ['icontains', 'exact']
+        else:
+            return_fields[name] = ['exact']
+
+    _filter_fields[model] = return_fields
+    return return_fields
+
+
+def clear_filter_fields():
+    """
+    Drops the cached filter fields, for instance in tests defining models dynamically.
+    """
+    _filter_fields.clear()
 
 
 class ModelViewSet(viewsets.ModelViewSet):
@@ -20,34 +170,202 @@ class ModelViewSet(viewsets.ModelViewSet):
     handle requests made to /collection as well as /collection?filter[name]=test.
     It's also possible to filter by a collection of primary keys, for example:
     /collection?filter[id__in]=1,2,3
-    Requests to filter on keys that do not exist will return an empty set.
+    Requests to filter on keys that do not exist will return an empty set. The filter
+    fields are computed once per model, see `get_filter_fields()`.
+
+    Setting `stream_list_responses` to True streams list responses rendered by the
+    remote_resource `JSONRenderer` one resource at a time, which bounds the memory
+    needed for large pages such as exports.
+
+    The local relations requested with `?include=` are loaded along with the queryset
+    through `select_related()` and `prefetch_related()`, rather than one resource at a
+    time by the renderer. Set `prefetch_included_resources` to False to opt out.
+
+    The `query` action lists the collection like a GET request, but takes its parameters
+    from a JSON body posted to /collection/query, which fits id lists too long for a URL.
+    Its permissions are checked as those of a GET request.
+
+    Setting `allow_bulk_writes` to True lets clients create resources by posting a list of
+    resource objects to /collection, and update them by patching a list of resource objects
+    to /collection/bulk. Each list is validated and written at once, in a transaction, by a
+    `BulkListSerializer`. Lists too large to be held in memory at once can be posted to
+    /collection/import instead, which reads and creates their resources `bulk_import_batch_size`
+    at a time, in a single transaction.
+
+    A sparse fieldset requested with `fields[type]=` for the resources of the view drops
+    the other fields from the serializer of read requests, and only loads their columns
+    when every requested field maps to a model field.
     """
+    stream_list_responses = False
+    stream_slice_size = 1000
+    prefetch_included_resources = True
+    allow_bulk_writes = False
+    bulk_list_serializer_class = BulkListSerializer
+    bulk_import_batch_size = 500
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super(ModelViewSet, self).get_serializer(*args, **kwargs)
+
+        sparse_field_names = self.get_sparse_field_names()
+        if sparse_field_names is not None:
+            restrict_serializer_fields(serializer, sparse_field_names)
+        return serializer
+
+    def get_sparse_field_names(self):
+        """
+        Returns the names of the serializer fields kept by the sparse fieldset of a read request, or None when
+        no sparse fieldset is requested for the resources of the view.
+        """
+        request = getattr(self, 'request', None)
+        if request is None:
+            return None
+        if request.method not in permissions.SAFE_METHODS:
+            return None
+
+        fieldset = get_sparse_fieldsets(request).get(utils.get_resource_name({'view': self}))
+        if fieldset is None:
+            return None
+
+        included_resources = utils.get_included_resources(request, self.get_serializer_class())
+        return get_sparse_field_names(fieldset, included_resources)
+
+    def filter_queryset(self, queryset):
+        queryset = super(ModelViewSet, self).filter_queryset(queryset)
+        if not isinstance(queryset, QuerySet):
+            return queryset
+
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        if self.prefetch_included_resources:
+            included_resources = utils.get_included_resources(self.request, serializer_class)
+            queryset = prefetch_included(queryset, serializer_class, included_resources, context)
+
+        sparse_field_names = self.get_sparse_field_names()
+        if sparse_field_names is not None:
+            only_fields = get_only_fields(queryset.model, serializer_class, sparse_field_names, context)
+            # Relations joined with `select_related()` can't be deferred
+            select_related = queryset.query.select_related
+            if only_fields is not None and select_related is not True:
+                only_fields.extend(select_related or ())
+                queryset = queryset.only(*only_fields)
+        return queryset
+
+    def check_permissions(self, request):
+        if getattr(self, 'action', None) == 'query':
+            # Querying the collection reads it like a GET request does
+            request = clone_request(request, 'GET')
+        super(ModelViewSet, self).check_permissions(request)
+
+    def list(self, request, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        if not (self.stream_list_responses and hasattr(renderer, 'render_stream')):
+            return super(ModelViewSet, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        links = None
+        meta = None
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            instances = page
+            # Paginators only build their links and meta along with a full response
+            paginated_data = self.get_paginated_response([]).data
+            links = paginated_data.get('links')
+            meta = paginated_data.get('meta')
+        elif queryset._prefetch_related_lookups:
+            # Slices need a stable order, and `iterator()` would skip the prefetching
+            if not queryset.ordered:
+                queryset = queryset.order_by('pk')
+            instances = iterate_in_slices(queryset, self.stream_slice_size)
+        else:
+            instances = queryset.iterator()
+
+        serializer = self.get_serializer(instances, many=True)
+        stream = renderer.render_stream(serializer, links, meta, self.get_renderer_context())
+        return StreamingHttpResponse(stream, content_type=request.accepted_media_type)
+
+    @collection_route(methods=['post'], parser_classes=(parsers.JSONParser,))
+    def query(self, request, *args, **kwargs):
+        """
+        Lists the collection with the filter, include, fields, sort and page parameters of the JSON body.
+        """
+        # Paginators build their links from the URL of the request. Point them to the GET request to the collection
+        # with the same parameters, since the query action only accepts POST requests.
+        query_params = get_query_params(request.data)
+        self.request = clone_query_request(request, query_params, get_collection_path(request.path))
+        return self.list(self.request, *args, **kwargs)
+
+    def get_bulk_serializer(self, *args, **kwargs):
+        """
+        Returns a `bulk_list_serializer_class` of the view's serializer, for bulk writes.
+        """
+        kwargs['context'] = self.get_serializer_context()
+        child = self.get_serializer_class()(context=kwargs['context'], partial=kwargs.get('partial', False))
+        return self.bulk_list_serializer_class(*args, child=child, **kwargs)
+
+    def check_bulk_data(self, request):
+        if not isinstance(request.data, list):
+            raise ParseError('Received data is not a list of JSONAPI Resource Objects')
+        if not self.allow_bulk_writes:
+            raise ParseError('Received data must be a single JSONAPI Resource Object')
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super(ModelViewSet, self).create(request, *args, **kwargs)
+
+        self.check_bulk_data(request)
+        serializer = self.get_bulk_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @collection_route(methods=['post'], url_path='import', parser_classes=(StreamingJSONParser,))
+    def bulk_import(self, request, *args, **kwargs):
+        """
+        Creates the resources of a list of resource objects, reading and writing them one batch at a time.
+        """
+        if not self.allow_bulk_writes:
+            raise MethodNotAllowed(request.method)
+        if isinstance(request.data, dict):
+            # An empty body is not parsed
+            raise ParseError('Received document does not contain primary data')
+
+        resource_objects = iter(request.data)
+        with transaction.atomic():
+            while True:
+                batch = list(islice(resource_objects, self.bulk_import_batch_size))
+                if not batch:
+                    break
+                serializer = self.get_bulk_serializer(data=batch)
+                serializer.is_valid(raise_exception=True)
+                self.perform_create(serializer)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @collection_route(methods=['patch'], url_path='bulk')
+    def bulk_update(self, request, *args, **kwargs):
+        """
+        Updates the resources of a list of resource objects at once.
+        """
+        self.check_bulk_data(request)
+        ids = [item.get('id') for item in request.data]
+        instances = list(self.filter_queryset(self.get_queryset()).filter(pk__in=ids))
+        for instance in instances:
+            self.check_object_permissions(request, instance)
+
+        serializer = self.get_bulk_serializer(instances, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            self.perform_update(serializer)
+        return Response(serializer.data)
 
     @property
     def filter_fields(self):
-        queryset = self.get_queryset()
-        return_fields = {}
-
-        fields = queryset.model._meta.get_fields()
-        for field in fields:
-            # For backwards compatibility GenericForeignKey should not be
-            # included in the results.
-            if field.is_relation and field.many_to_one and field.related_model is None:
-                continue
-            # Relations to child proxy models should not be included.
-            if (field.model != queryset.model._meta.model and
-                    field.model._meta.concrete_model == queryset.model._meta.concrete_model):
-                continue
-
-            name = field.attname if hasattr(field, 'attname') else field.name
-            if hasattr(field, 'primary_key') and field.primary_key:
-                return_fields['id'] = ['in', 'exact']
-            elif CharField in field.__class__.__mro__ or TextField in field.__class__.__mro__:
-                return_fields[name] = ['icontains', 'exact']
-            else:
-                return_fields[name] = ['exact']
-
-        return return_fields
+        # The queryset attribute is enough to know the model, without building the queryset of the request
+        model = self.queryset.model if self.queryset is not None else self.get_queryset().model
+
+        # Copied, since views may extend the filter fields of their model
+        return dict(get_filter_fields(model))
 
     def has_ids_query_params(self):
         return hasattr(self.request, 'query_params') and 'filter[id__in]' in self.request.query_params
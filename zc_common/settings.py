@@ -4,7 +4,25 @@ import os
 
 DEFAULTS = {
     'GATEWAY_ROOT_PATH': getattr(
-        settings, 'GATEWAY_ROOT_PATH', os.environ.get('GATEWAY_ROOT_PATH', 'http://gateway:4000/'))
+        settings, 'GATEWAY_ROOT_PATH', os.environ.get('GATEWAY_ROOT_PATH', 'http://gateway:4000/')),
+    # Number of remote include requests a single response may have in flight at once (1 fetches serially)
+    'REMOTE_INCLUDE_MAX_WORKERS': getattr(settings, 'REMOTE_INCLUDE_MAX_WORKERS', 1),
+    # Deadline in seconds for fetching all remote includes of a response, or None for no deadline
+    'REMOTE_INCLUDE_TIMEOUT': getattr(settings, 'REMOTE_INCLUDE_TIMEOUT', None),
+    # Maximum number of ids per bulk `filter[id__in]=` remote include request, or None to fetch one by one
+    'REMOTE_INCLUDE_BATCH_SIZE': getattr(settings, 'REMOTE_INCLUDE_BATCH_SIZE', None),
+    # Whether to render the hit and miss counts of the remote includes of a response in its `meta`, for metrics
+    'REMOTE_INCLUDE_STATS_IN_META': getattr(settings, 'REMOTE_INCLUDE_STATS_IN_META', False),
+    # Configuration of the remote resource document cache shared across requests, see `remote_resource.cache`
+    'REMOTE_RESOURCE_CACHE': getattr(settings, 'REMOTE_RESOURCE_CACHE', None),
+    # Circuit breaker of remote include requests per resource type, e.g. {'FAILURE_THRESHOLD': 5, 'COOL_DOWN': 30}
+    'REMOTE_INCLUDE_CIRCUIT_BREAKER': getattr(settings, 'REMOTE_INCLUDE_CIRCUIT_BREAKER', None),
+    # Seconds to cache the exact counts of paginated querysets for, keyed on their SQL, or 0 not to cache them
+    'PAGINATION_COUNT_CACHE_TIMEOUT': getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 0),
+    # Number of values from which `__in` filters are bound as a single PostgreSQL array, or None to never do it
+    'FILTER_IN_ARRAY_THRESHOLD': getattr(settings, 'FILTER_IN_ARRAY_THRESHOLD', None),
+    # Number of verified JWTs whose payload is cached until they expire, or 0 to verify every token of every request
+    'JWT_VERIFICATION_CACHE_SIZE': getattr(settings, 'JWT_VERIFICATION_CACHE_SIZE', 0),
 }
 
 zc_settings = APISettings(None, DEFAULTS, None)